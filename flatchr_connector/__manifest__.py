@@ -6,7 +6,7 @@
         order to ingest them in your Odoo database.
         """,
     "category": "",
-    "version": "15.0.1.0.0",
+    "version": "15.0.1.1.0",
     "author": "ELITE Advanced technologies",
     "website": "http://www.odoo.com",
     "license": "OEEL-1",
@@ -16,11 +16,22 @@
     ],
     "data": [
         "data/ir_cron.xml",
+        "data/flatchr_sync_state.xml",
         "views/hr_applicant.xml",
         "views/hr_job.xml",
         "views/res_partner_view.xml",
         "views/res_config_settings.xml",
+        "views/flatchr_account_views.xml",
+        "views/flatchr_sync_job_views.xml",
+        "views/flatchr_sync_run_views.xml",
+        "views/flatchr_applicant_quarantine_views.xml",
+        "views/flatchr_webhook_event_views.xml",
         "wizard/csv_dl_wizard.xml",
         "security/ir.model.access.csv"
     ],
+    "assets": {
+        "web.assets_backend": [
+            "flatchr_connector/static/src/js/flatchr_sync_job_form.js",
+        ],
+    },
 }
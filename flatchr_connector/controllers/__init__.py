@@ -0,0 +1 @@
+from . import flatchr_webhook
@@ -0,0 +1,27 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import http
+from odoo.http import request
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class FlatchrWebhook(http.Controller):
+
+    @http.route('/flatchr_connector/webhook', type='http', auth='public', methods=['POST'], csrf=False)
+    def receive(self, **kwargs):
+        """Queue the events pushed by Flatchr, they are processed by the webhook events cron."""
+        body = request.httprequest.get_data()
+        events = request.env['flatchr.webhook.event'].sudo()
+        if not events.check_signature(body, request.httprequest.headers.get('X-Flatchr-Signature')):
+            _logger.warning("******* Évènement Flatchr rejeté : signature invalide")
+            return request.make_response('Invalid signature', status=401)
+        try:
+            events.receive(body)
+        except (ValueError, KeyError, TypeError) as e:
+            _logger.warning("******* Évènement Flatchr rejeté : %s" % e)
+            return request.make_response('Invalid payload', status=400)
+        return request.make_response('OK')
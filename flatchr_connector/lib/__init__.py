@@ -0,0 +1,2 @@
+from . import flatchr_client
+from . import flatchr_diff
@@ -0,0 +1,205 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+_logger = logging.getLogger(__name__)
+
+CAREERS_URL = 'https://careers.flatchr.io'
+API_URL = 'https://api.flatchr.io'
+REQUEST_TIMEOUT = 30
+STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_RATE_LIMIT = 10  # requests per second
+DEFAULT_MAX_RETRIES = 4
+RETRY_BACKOFF = 1  # seconds, doubled at each attempt
+MAX_RETRY_WAIT = 120
+
+
+def iter_json_array(chunks):
+    """Yield one by one the items of a JSON array read from an iterable of text chunks.
+
+    Only the item being decoded is kept in memory, whatever the size of the array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    for chunk in chunks:
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("Expected a JSON array, got %r" % buffer[position:position + 50])
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break  # the item is not complete yet, wait for the next chunk
+            # A number or a literal is only complete once followed by a delimiter, "4." goes on in "5]"
+            if buffer[position] not in '{["' and (end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+                break
+            yield item
+            position = end
+    raise ValueError("Unexpected end of the JSON array")
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket allowing `rate` acquisitions per second with bursts of `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FlatchrClient(object):
+    """HTTP client shared by the threads of a Flatchr synchronisation.
+
+    It keeps a pool of keep-alive connections, spaces the requests with a token bucket,
+    retries the throttled (429), failed (5xx) and timed out requests with a jittered exponential
+    backoff honouring Retry-After, and collects the latency of every request per endpoint.
+    """
+
+    def __init__(self, token, careers_url=CAREERS_URL, api_url=API_URL, pool_size=8,
+                 rate_limit=DEFAULT_RATE_LIMIT, max_retries=DEFAULT_MAX_RETRIES, timeout=REQUEST_TIMEOUT):
+        self.careers_url = careers_url
+        self.api_url = api_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate_limit)
+
+        self.session = requests.Session()
+        # one more connection than workers for the streamed applicants search
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size + 1)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+        })
+
+        self.metrics = {}
+        self.metrics_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def request(self, method, url, endpoint, **kwargs):
+        """Send a request through the rate limiter, with retries, and return the response.
+
+        The last response is returned when the retries are exhausted, the caller decides
+        how to handle its status. Network errors are raised after the last attempt.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (ConnectionError, Timeout):
+                self._record(endpoint, start, error=True)
+                if attempt == self.max_retries:
+                    raise
+                wait = self._backoff(attempt)
+            else:
+                self._record(endpoint, start, error=response.status_code >= 400)
+                if (response.status_code != 429 and response.status_code < 500) or attempt == self.max_retries:
+                    return response
+                wait = self._retry_after(response)
+                if wait is None:
+                    wait = self._backoff(attempt)
+                response.close()
+            _logger.info("Requête Flatchr %s relancée dans %.1fs (tentative %s)" % (endpoint, wait, attempt + 1))
+            time.sleep(wait)
+
+    @staticmethod
+    def _backoff(attempt):
+        return min(MAX_RETRY_WAIT, RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def _retry_after(response):
+        """Return the wait in seconds asked by the Retry-After header, None when absent or invalid."""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        if value.isdigit():
+            return min(MAX_RETRY_WAIT, int(value))
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return min(MAX_RETRY_WAIT, max(0, (retry_at - datetime.now(timezone.utc)).total_seconds()))
+
+    def _record(self, endpoint, start, error=False):
+        end = time.monotonic()
+        with self.metrics_lock:
+            metric = self.metrics.setdefault(endpoint, {'latencies': [], 'errors': 0, 'start': start, 'end': end})
+            metric['latencies'].append(end - start)
+            metric['errors'] += int(error)
+            metric['end'] = end
+
+    def log_metrics(self):
+        for endpoint, metric in sorted(self.metrics.items()):
+            latencies = sorted(metric['latencies'])
+            duration = metric['end'] - metric['start']
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            _logger.info("******* Flatchr %s : %s requêtes (%s erreurs), %.1f req/s, moyenne %.0f ms, p95 %.0f ms" % (
+                endpoint, len(latencies), metric['errors'], len(latencies) / duration if duration else 0.0,
+                sum(latencies) / len(latencies) * 1000, p95 * 1000))
+
+    def get_feed(self, slug, headers=None, method='GET'):
+        return self.request(method, f'{self.careers_url}/company/{slug}.json', 'feed',
+                            headers=dict({'Accept': '*/*'}, **(headers or {})))
+
+    def search_applicants(self, company_key, criteria, stream=False):
+        url = f'{self.api_url}/company/{company_key}/search/applicants?fields=candidate,vacancy,candidate.consent'
+        return self.request('POST', url, 'search', data=json.dumps(criteria), stream=stream)
+
+    def iter_applicants(self, response):
+        """Stream the applicants of a search response."""
+        response.encoding = response.encoding or 'utf-8'
+        return iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True))
+
+    def get_applicant(self, company_key, flatchr_applicant_id):
+        url = f'{self.api_url}/company/{company_key}/applicant/{flatchr_applicant_id}?fields=candidate,vacancy,candidate.consent'
+        return self.request('GET', url, 'applicant')
@@ -0,0 +1,33 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from collections import Counter, defaultdict
+import csv
+import io
+
+DIFF_HEADER = ('Model', 'Flatchr ID', 'Name', 'Action', 'Changed fields')
+
+
+class DiffReport(object):
+    """In-memory report of what a synchronisation would create, update or leave unchanged."""
+
+    def __init__(self):
+        self.rows = []
+        self.created = defaultdict(set)  # model: Flatchr IDs of the records that would be created
+
+    def add(self, model, flatchr_id, name, action, changed_fields=()):
+        self.rows.append((model, str(flatchr_id), name or '', action, ', '.join(changed_fields)))
+        if action == 'create':
+            self.created[model].add(str(flatchr_id))
+
+    def counts(self):
+        """Return a {(model, action): number of records} Counter."""
+        return Counter((row[0], row[3]) for row in self.rows)
+
+    def to_csv(self):
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=';')
+        writer.writerow(DIFF_HEADER)
+        writer.writerows(self.rows)
+        return output.getvalue().encode('utf-8')
@@ -0,0 +1,53 @@
+import logging
+
+from odoo.addons.flatchr_connector.migrations import util
+
+_logger = logging.getLogger(__name__)
+
+# (model, column) pairs receiving a unique constraint in this version
+FLATCHR_EXTERNAL_IDS = (
+    ('hr.job', 'flatchr_job_id'),
+    ('res.partner', 'flatchr_applicant_id'),
+    ('hr.applicant', 'flatchr_applicant_id'),
+    ('hr.contract.type', 'flatchr_id'),
+    ('hr.education.level', 'flatchr_id'),
+    ('hr.activity', 'flatchr_id'),
+    ('hr.channel', 'flatchr_id'),
+    ('hr.metier', 'flatchr_id'),
+)
+
+
+def migrate(cr, version):
+    _logger.info("######################### Begin pre_10 #########################")
+
+    _logger.info("----------MERGE FLATCHR DUPLICATES----------")
+
+    for model, column in FLATCHR_EXTERNAL_IDS:
+        table = util.table_of_model(cr, model)
+        if not util.column_exists(cr, table, column):
+            continue
+
+        # Keep the active record of each Flatchr ID, then the last modified one, the others are merged into it:
+        # the refused applicants were archived and created again, the new record is the one followed by the recruiters
+        order = "write_date DESC NULLS LAST, id DESC"
+        if util.column_exists(cr, table, "active"):
+            order = "active DESC NULLS LAST, " + order
+        cr.execute(
+            """
+            SELECT array_agg(id ORDER BY {order})
+              FROM {table}
+             WHERE {column} IS NOT NULL
+          GROUP BY {column}
+            HAVING count(*) > 1
+        """.format(table=table, column=column, order=order)
+        )
+        id_mapping = {dup_id: ids[0] for ids, in cr.fetchall() for dup_id in ids[1:]}
+        if not id_mapping:
+            continue
+
+        _logger.info("merge %s duplicated %s on model %s" % (len(id_mapping), column, model))
+        for dup_id, keep_id in sorted(id_mapping.items()):
+            _logger.info("merge %s(%s) into %s(%s)" % (model, dup_id, model, keep_id))
+        # The merge stays on the migration cursor, a failure must not leave the database half merged
+        util.replace_record_references_batch(cr, id_mapping, model)
+        cr.execute("DELETE FROM {table} WHERE id IN %s".format(table=table), [tuple(id_mapping)])
@@ -5,6 +5,7 @@ import collections
 import datetime
 import json
 import logging
+import math
 import os
 import re
 import sys
@@ -85,6 +86,11 @@ try:
 except ImportError:
     ThreadPoolExecutor = None
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 _logger = logging.getLogger(__name__)
 
 _INSTALLED_MODULE_STATES = ("installed", "to install", "to upgrade")
@@ -96,6 +102,13 @@ ENVIRON = {
 
 NEARLYWARN = 25  # (between and info, appear on runbot build page)
 
+# bounds of the number of rows per bucket of `explode_query_range`
+EXPLODE_MIN_BUCKET_ROWS = 10000
+EXPLODE_MAX_BUCKET_ROWS = 1000000
+# bounds of the chunk size of `iter_browse` when a memory budget is given
+ITER_BROWSE_MIN_CHUNK = 10
+ITER_BROWSE_MAX_CHUNK = 10000
+
 # python3 shims
 try:
     basestring
@@ -303,6 +316,44 @@ def explode_query(cr, query, num_buckets=8, prefix=""):
     ]
 
 
+def explode_query_range(cr, query, table, bucket_size=None, prefix=""):
+    """
+    Explode a query to multiple queries on contiguous ranges of ids that can be executed in parallel
+    Unlike the `mod(abs(id), N)` filter of `explode_query`, each range can use the primary key
+    index, so that every worker only reads its own part of `table`.
+    When `bucket_size` (a number of ids) is not given, the number of buckets is picked from the
+    estimated size of the table (`pg_class.reltuples`) and `get_max_workers()`: small tables give a
+    single query, medium ones 4 buckets per worker and big ones buckets of about a million rows.
+    """
+    if "{parallel_filter}" not in query:
+        sep_kw = " AND " if re.search(r"\sWHERE\s", query, re.M | re.I) else " WHERE "
+        query += sep_kw + "{parallel_filter}"
+
+    cr.execute('SELECT min(id), max(id) FROM "%s"' % table)
+    min_id, max_id = cr.fetchone()
+    if min_id is None:
+        return []
+    span = max_id - min_id + 1
+
+    if bucket_size is None:
+        cr.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", ['"%s"' % table])
+        rows = cr.fetchone()[0]
+        if rows <= 0:
+            # never analyzed
+            rows = span
+        num_buckets = min(
+            int(math.ceil(rows / float(EXPLODE_MIN_BUCKET_ROWS))),
+            max(get_max_workers() * 4, int(math.ceil(rows / float(EXPLODE_MAX_BUCKET_ROWS)))),
+        )
+        bucket_size = int(math.ceil(span / float(max(num_buckets, 1))))
+
+    parallel_filter = "{prefix}id BETWEEN %s AND %s".format(prefix=prefix)
+    return [
+        cr.mogrify(query.format(parallel_filter=parallel_filter), [start, min(start + bucket_size - 1, max_id)]).decode()
+        for start in range(min_id, max_id + 1, bucket_size)
+    ]
+
+
 def pg_array_uniq(a, drop_null=False):
     dn = "WHERE x IS NOT NULL" if drop_null else ""
     return "ARRAY(SELECT x FROM unnest({}) x {} GROUP BY x)".format(a, dn)
@@ -3126,7 +3177,7 @@ def recompute_fields(cr, model, fields, ids=None, logger=_logger, chunk_size=256
         cr.execute('SELECT id FROM "%s"' % table_of_model(cr, model))
         ids = tuple(map(itemgetter(0), cr.fetchall()))
 
-    size = (len(ids) + chunk_size - 1) / chunk_size
+    size = (len(ids) + chunk_size - 1) // chunk_size
     qual = "%s %d-bucket" % (model, chunk_size) if chunk_size != 1 else model
     for subids in log_progress(chunks(ids, chunk_size, list), qualifier=qual, logger=logger, size=size):
         records = Model.browse(subids)
@@ -3141,6 +3192,52 @@ def recompute_fields(cr, model, fields, ids=None, logger=_logger, chunk_size=256
         records.invalidate_cache()
 
 
+if ThreadPoolExecutor is None:
+
+    def parallel_recompute_fields(cr, model, fields, ids=None, logger=_logger, chunk_size=256, num_buckets=None):
+        recompute_fields(cr, model, fields, ids=ids, logger=logger, chunk_size=chunk_size)
+
+
+else:
+
+    def parallel_recompute_fields(cr, model, fields, ids=None, logger=_logger, chunk_size=256, num_buckets=None):
+        """
+        Recompute fields in parallel
+        The ids are split into `num_buckets` ranges of consecutive ids (by default 4 per worker),
+        each recomputed by `recompute_fields` on its own cursor and commited once done.
+        Only use it for fields whose computation writes on the recomputed records only,
+        concurrent writes on shared records would deadlock the workers.
+        Side effect: the given cursor is commited.
+        """
+        model = model if isinstance(model, basestring) else model._name
+        if ids is None:
+            cr.execute('SELECT id FROM "%s"' % table_of_model(cr, model))
+            ids = tuple(map(itemgetter(0), cr.fetchall()))
+        if not ids:
+            return
+        ids = sorted(ids)
+
+        max_workers = get_max_workers()
+        num_buckets = num_buckets or max_workers * 4
+        num_buckets = max(1, min(num_buckets, (len(ids) + chunk_size - 1) // chunk_size))
+        bucket_size = (len(ids) + num_buckets - 1) // num_buckets
+        buckets = list(chunks(ids, bucket_size, list))
+        reg = env(cr).registry
+
+        def recompute(bucket):
+            with manage_env(), reg.cursor() as bucket_cr:
+                recompute_fields(bucket_cr, model, fields, ids=bucket, logger=logger, chunk_size=chunk_size)
+                bucket_cr.commit()
+
+        cr.commit()
+
+        qual = "%s %d-bucket" % (model, bucket_size)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(buckets))) as executor:
+            for _ in log_progress(executor.map(recompute, buckets), qualifier=qual, logger=logger, size=len(buckets)):
+                pass
+        env(cr)[model].invalidate_cache()
+
+
 def check_company_fields(
     cr, model_name, field_name, logger=_logger, model_company_field="company_id", comodel_company_field="company_id"
 ):
@@ -3538,33 +3635,91 @@ def iter_browse(model, *args, **kw):
     """
     Iterate and browse through record without filling the cache.
     `args` can be `cr, uid, ids` or just `ids` depending on kind of `model` (old/new api)
+    Keyword-only arguments:
+    - `chunk_size`: number of records browsed at once (200 by default)
+    - `fields`: names of the only fields prefetched for each chunk, the other ones are read when accessed
+    - `commit`: commit the cursor once each chunk has been processed
+    - `memory_budget`: memory, in MB, that a chunk may use; the chunk size is adapted to the memory
+      growth of the previous chunk, measured from the cache emptied of the chunk before it, between
+      ITER_BROWSE_MIN_CHUNK and ITER_BROWSE_MAX_CHUNK (needs psutil)
+    - `on_chunk`: called with the records and the processing time of each chunk once processed
+    - `logger`: logger of the progress, `None` to disable it
     """
     assert len(args) in [1, 3]  # either (cr, uid, ids) or (ids,)
     cr_uid = args[:-1]
-    ids = args[-1]
+    ids = list(args[-1])
     chunk_size = kw.pop("chunk_size", 200)  # keyword-only argument
     logger = kw.pop("logger", _logger)
+    fields = kw.pop("fields", None)
+    commit = kw.pop("commit", False)
+    memory_budget = kw.pop("memory_budget", None)
+    on_chunk = kw.pop("on_chunk", None)
     if kw:
         raise TypeError("Unknow arguments: %s" % ", ".join(kw))
 
+    cr = cr_uid[0] if cr_uid else model.env.cr
+    process = psutil.Process() if memory_budget and psutil else None
+    timings = []
+
     def browse(ids):
-        model.invalidate_cache(*cr_uid)
         args = cr_uid + (list(ids),)
-        return model.browse(*args)
-
-    def end():
+        records = model.browse(*args)
+        if fields is not None and not cr_uid:
+            records = records.with_context(prefetch_fields=False)
+            records.read(fields, load="_classic_write")
+        return records
+
+    def iterate():
+        size = chunk_size
+        position = 0
+        while position < len(ids):
+            chunk_ids = ids[position : position + size]
+            position += len(chunk_ids)
+            t0 = time.time()
+            model.invalidate_cache(*cr_uid)
+            # sampled once the previous chunk is out of the cache, so that only this chunk is measured
+            rss = process.memory_info().rss if process else 0
+            records = browse(chunk_ids)
+            for record in records:
+                yield record
+            # the whole chunk has been processed by the caller
+            if commit:
+                cr.commit()
+            duration = time.time() - t0
+            timings.append((len(chunk_ids), duration))
+            if on_chunk:
+                on_chunk(records, duration)
+            if process:
+                growth = process.memory_info().rss - rss
+                # without growth, the chunk fitted in the memory freed by the previous one and tells nothing
+                # about the cost of a larger chunk: its size is kept
+                if growth > 0:
+                    budget_size = int(memory_budget * 1024 * 1024 * len(chunk_ids) / growth)
+                    # grow gradually, the first chunks are not representative of the cache being warm
+                    size = max(ITER_BROWSE_MIN_CHUNK, min(budget_size, size * 2, ITER_BROWSE_MAX_CHUNK))
         model.invalidate_cache(*cr_uid)
-        if 0:
-            yield
 
-    it = chain.from_iterable(chunks(ids, chunk_size, fmt=browse))
-    if logger:
-        it = log_progress(it, qualifier=model._name, logger=logger, size=len(ids))
+    def timing():
+        if not timings:
+            return ""
+        count, duration = timings[-1]
+        return "last chunk: %d records in %.2fs, average: %.2fs per chunk" % (
+            count,
+            duration,
+            sum(t for _, t in timings) / len(timings),
+        )
 
-    return chain(it, end())
+    it = iterate()
+    if logger:
+        it = log_progress(it, qualifier=model._name, logger=logger, size=len(ids), extra=timing)
+    return it
 
 
-def log_progress(it, qualifier="elements", logger=_logger, size=None):
+def log_progress(it, qualifier="elements", logger=_logger, size=None, extra=None):
+    """
+    Log the progress and the estimated total time of the iteration every minute.
+    `extra` is an optional callable returning a string appended to the log.
+    """
     if size is None:
         size = len(it)
     size = float(size)
@@ -3575,14 +3730,16 @@ def log_progress(it, qualifier="elements", logger=_logger, size=None):
         if (t2 - t1).total_seconds() > 60:
             t1 = datetime.datetime.now()
             tdiff = t2 - t0
+            extra_info = extra() if extra else ""
             logger.info(
-                "[%.02f%%] %d/%d %s processed in %s (TOTAL estimated time: %s)",
+                "[%.02f%%] %d/%d %s processed in %s (TOTAL estimated time: %s)%s",
                 (i / size * 100.0),
                 i,
                 size,
                 qualifier,
                 tdiff,
                 datetime.timedelta(seconds=tdiff.total_seconds() * size / i),
+                " (%s)" % extra_info if extra_info else "",
             )
 
 
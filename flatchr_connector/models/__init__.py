@@ -7,3 +7,10 @@ from . import hr_activity
 from . import hr_channel
 from . import hr_metier
 from . import hr_job
+from . import flatchr_sync_state
+from . import flatchr_cv_import_line
+from . import flatchr_sync_job
+from . import flatchr_sync_run
+from . import flatchr_applicant_quarantine
+from . import flatchr_webhook_event
+from . import flatchr_account
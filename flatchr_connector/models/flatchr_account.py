@@ -0,0 +1,121 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from concurrent.futures import ThreadPoolExecutor
+from dateutil.relativedelta import relativedelta
+from odoo import SUPERUSER_ID, api, fields, models
+from odoo.addons.flatchr_connector.lib.flatchr_client import API_URL, CAREERS_URL, DEFAULT_RATE_LIMIT
+from odoo.addons.flatchr_connector.models.hr_job import DEFAULT_SYNC_WORKERS, FlatchrSyncLocked
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_ACCOUNT_WORKERS = 4
+
+
+class FlatchrAccount(models.Model):
+    _name = 'flatchr.account'
+    _description = 'Flatchr account'
+    _order = 'name'
+
+    name = fields.Char("Name", required=True)
+    active = fields.Boolean("Active", default=True)
+    company_id = fields.Many2one("res.company", string="Company", required=True, default=lambda self: self.env.company,
+                                 help="Company of the jobs and applicants imported from this account")
+    flatchr_enterprise_slug = fields.Char("Flatchr slug", required=True)
+    flatchr_company_key = fields.Char("Flatchr company key", required=True)
+    # Only readable by the administrators, as the system parameter of the global settings; required in the form
+    flatchr_token = fields.Char("Flatchr token", groups="base.group_system")
+    careers_url = fields.Char("Careers URL", required=True, default=CAREERS_URL)
+    api_url = fields.Char("API URL", required=True, default=API_URL)
+    sync_period = fields.Integer("Sync period", default=365, required=True, help="Days of applicants fetched by a full synchronisation")
+    sync_workers = fields.Integer("Sync workers", default=DEFAULT_SYNC_WORKERS, required=True,
+                                  help="Number of concurrent requests used to fetch the applicants details from Flatchr")
+    rate_limit = fields.Float("Rate limit", default=DEFAULT_RATE_LIMIT, required=True,
+                              help="Maximum number of requests per second sent to the Flatchr API")
+    interval_number = fields.Integer("Synchronise every", default=12, required=True)
+    interval_type = fields.Selection([("hours", "Hours"), ("days", "Days")], "Interval unit", default="hours", required=True)
+    nextcall = fields.Datetime("Next synchronisation", required=True, default=fields.Datetime.now)
+    sync_state_ids = fields.One2many("flatchr.sync.state", "account_id", string="Synchronisation states")
+    last_sync_date = fields.Datetime("Last synchronisation date", compute="_compute_last_sync_date")
+
+    _sql_constraints = [
+        ('flatchr_company_key_uniq', 'unique (flatchr_company_key)', "Flatchr account already exists !"),
+    ]
+
+    @api.depends('sync_state_ids.last_sync_date')
+    def _compute_last_sync_date(self):
+        for account in self:
+            account.last_sync_date = account.sync_state_ids[:1].last_sync_date
+
+    def get_config(self):
+        """Return the settings of the account in the format of hr.job get_flatchr_config."""
+        self.ensure_one()
+        account = self.sudo()
+        return {
+            'slug': account.flatchr_enterprise_slug,
+            'company_key': account.flatchr_company_key,
+            'token': account.flatchr_token,
+            'careers_url': account.careers_url,
+            'api_url': account.api_url,
+            'sync_period': account.sync_period,
+            'sync_workers': max(1, account.sync_workers),
+            'rate_limit': account.rate_limit if account.rate_limit > 0 else DEFAULT_RATE_LIMIT,
+        }
+
+    def action_check_connection(self):
+        self.ensure_one()
+        self.env['hr.job'].check_flatchr_connection(account=self)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': self.name,
+                'message': 'Odoo was succesfully able to reach the Flatchr servers with your credentials.',
+                'type': 'success',
+            }
+        }
+
+    def action_sync(self):
+        self.ensure_one()
+        return self.env['flatchr.sync.job'].enqueue('sync', account_id=self.id).action_open()
+
+    def action_full_sync(self):
+        self.ensure_one()
+        return self.env['flatchr.sync.job'].enqueue('full_sync', account_id=self.id).action_open()
+
+    def action_dry_run(self):
+        self.ensure_one()
+        return self.env['flatchr.sync.job'].enqueue('dry_run', account_id=self.id).action_open()
+
+    @api.model
+    def run_due_accounts(self):
+        """Synchronise the accounts whose next synchronisation is due, called by the dispatcher cron.
+
+        The accounts run concurrently, each on its own cursor, so that a large one does not delay the others.
+        """
+        account_ids = self.search([('nextcall', '<=', fields.Datetime.now())]).ids
+        if not account_ids:
+            return
+        max_workers = int(self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.account_workers', DEFAULT_ACCOUNT_WORKERS))
+        _logger.info("******* Synchronisation de %s comptes Flatchr" % len(account_ids))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(account_ids)))) as executor:
+            list(executor.map(self._run_account, account_ids))
+
+    def _run_account(self, account_id):
+        with self.pool.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            account = env['flatchr.account'].browse(account_id)
+            try:
+                env['hr.job'].fetch_flatchr_data(account=account)
+            except FlatchrSyncLocked:
+                # Locked by a synchronisation queued from the account, it is retried by the next dispatch
+                cr.rollback()
+                _logger.info("******* Le compte Flatchr %s est déjà en cours de synchronisation" % account.name)
+                return
+            except Exception:
+                cr.rollback()
+                _logger.exception("******* Échec de la synchronisation du compte Flatchr %s" % account.name)
+            account.nextcall = fields.Datetime.now() + relativedelta(**{account.interval_type: account.interval_number})
+            cr.commit()
@@ -0,0 +1,62 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class FlatchrApplicantQuarantine(models.Model):
+    _name = 'flatchr.applicant.quarantine'
+    _description = 'Flatchr applicant quarantined by the synchronisation'
+    _order = 'id desc'
+    _rec_name = 'flatchr_applicant_id'
+
+    flatchr_applicant_id = fields.Char("Flatchr applicant ID", required=True, readonly=True)
+    flatchr_vacancy_id = fields.Char("Flatchr vacancy ID", readonly=True)
+    payload = fields.Text("Payload", readonly=True, help="Applicant as returned by the Flatchr applicants search")
+    error = fields.Text("Error", readonly=True)
+    run_id = fields.Many2one("flatchr.sync.run", string="Run", readonly=True, ondelete="set null")
+    state = fields.Selection([
+        ("quarantined", "Quarantined"),
+        ("resolved", "Resolved"),
+    ], "State", required=True, default="quarantined", readonly=True)
+
+    _sql_constraints = [
+        ('flatchr_applicant_id_uniq', 'unique (flatchr_applicant_id)', "Flatchr applicant already quarantined !"),
+    ]
+
+    @api.model
+    def quarantine(self, applicant, flatchr_vacancy_id, error, run=None):
+        """Record an applicant that could not be imported, replacing its previous quarantine if any."""
+        vals = {
+            'flatchr_applicant_id': str(applicant['applicant']),
+            'flatchr_vacancy_id': flatchr_vacancy_id and str(flatchr_vacancy_id),
+            'payload': json.dumps(applicant),
+            'error': error,
+            'run_id': run and run.id,
+            'state': 'quarantined',
+        }
+        record = self.search([('flatchr_applicant_id', '=', vals['flatchr_applicant_id'])])
+        if record:
+            record.write(vals)
+        else:
+            record = self.create(vals)
+        return record
+
+    def action_retry(self):
+        """Import the quarantined applicants again, those failing once more stay quarantined."""
+        for record in self.filtered(lambda r: r.state == 'quarantined'):
+            applicant = json.loads(record.payload)
+            try:
+                with self.env.cr.savepoint():
+                    self.env['hr.job'].upsert_applicants([applicant], {applicant['applicant']: record.flatchr_vacancy_id})
+            except Exception as e:
+                _logger.warning("******* Candidat Flatchr %s toujours en quarantaine : %s" % (record.flatchr_applicant_id, e))
+                record.error = str(e)
+            else:
+                record.state = 'resolved'
+        return True
@@ -0,0 +1,47 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import hashlib
+from odoo import fields, models
+
+
+class FlatchrCvImportLine(models.Model):
+    _name = 'flatchr.cv.import.line'
+    _description = 'Flatchr CV import line'
+    _order = 'id desc'
+
+    row_key = fields.Char("Row key", required=True, index=True, help="Hash of the email, job and download URL of the CSV row")
+    applicant_id = fields.Many2one("hr.applicant", string="Applicant", required=True, ondelete="cascade")
+    download_url = fields.Char("Download URL")
+    state = fields.Selection([("done", "Done"), ("failed", "Failed")], "State", required=True)
+    attempts = fields.Integer("Attempts")
+    error = fields.Text("Error")
+
+    _sql_constraints = [
+        ('row_applicant_uniq', 'unique (row_key, applicant_id)', "CV import line already exists !"),
+    ]
+
+    @staticmethod
+    def get_row_key(row):
+        return hashlib.sha1(';'.join([row[1], row[3], row[2]]).encode()).hexdigest()
+
+    def get_done_keys(self, row_keys):
+        """Return the (row key, applicant id) pairs already imported among `row_keys`."""
+        lines = self.search_read([('row_key', 'in', list(row_keys)), ('state', '=', 'done')], ['row_key', 'applicant_id'])
+        return {(line['row_key'], line['applicant_id'][0]) for line in lines}
+
+    def log_results(self, results):
+        """Save the outcome of a batch of downloads, `results` being a list of vals dicts."""
+        existing = {
+            (line.row_key, line.applicant_id.id): line
+            for line in self.search([('row_key', 'in', [vals['row_key'] for vals in results])])
+        }
+        new_vals = []
+        for vals in results:
+            line = existing.get((vals['row_key'], vals['applicant_id']))
+            if line:
+                line.write(dict(vals, attempts=line.attempts + vals['attempts']))
+            else:
+                new_vals.append(vals)
+        self.create(new_vals)
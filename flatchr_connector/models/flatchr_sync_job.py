@@ -0,0 +1,137 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from datetime import timedelta
+from odoo import _, api, fields, models
+import logging
+import traceback
+
+_logger = logging.getLogger(__name__)
+
+# First key of the advisory locks held by the cursors running the jobs
+JOB_LOCK_KEY = 0x466c6a62
+
+
+class FlatchrSyncJob(models.Model):
+    _name = 'flatchr.sync.job'
+    _description = 'Flatchr synchronisation job'
+    _order = 'id desc'
+
+    name = fields.Char("Name", required=True)
+    job_type = fields.Selection([
+        ("sync", "Synchronisation"),
+        ("full_sync", "Full synchronisation"),
+        ("cv_import", "Synchronisation and CV import"),
+        ("dry_run", "Dry run"),
+    ], "Type", required=True, default="sync")
+    state = fields.Selection([
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ], "State", required=True, default="pending", readonly=True)
+    csv_file = fields.Binary("CSV file", attachment=True)
+    account_id = fields.Many2one("flatchr.account", string="Account", ondelete="cascade",
+                                 help="Flatchr account synchronised, the global settings are used when empty")
+    user_id = fields.Many2one("res.users", string="Requested by", default=lambda self: self.env.user, readonly=True)
+    date_start = fields.Datetime("Start date", readonly=True)
+    date_end = fields.Datetime("End date", readonly=True)
+    vacancies_done = fields.Integer("Vacancies done", readonly=True)
+    applicants_done = fields.Integer("Applicants done", readonly=True)
+    progress = fields.Float("Progress", readonly=True, help="Estimated progress of the job, in percent")
+    date_eta = fields.Datetime("Estimated end date", compute="_compute_date_eta")
+    error = fields.Text("Error", readonly=True)
+
+    @api.depends('state', 'date_start', 'progress')
+    def _compute_date_eta(self):
+        now = fields.Datetime.now()
+        for job in self:
+            if job.state == 'running' and job.date_start and 0 < job.progress < 100:
+                elapsed = (now - job.date_start).total_seconds()
+                job.date_eta = now + timedelta(seconds=elapsed * (100 - job.progress) / job.progress)
+            else:
+                job.date_eta = job.date_end
+
+    @api.model
+    def enqueue(self, job_type, **vals):
+        """Create a pending job and wake the runner up, return the job."""
+        job = self.create(dict(vals, job_type=job_type, name=dict(self._fields['job_type'].selection)[job_type]))
+        self.env.ref('flatchr_connector.cron_run_flatchr_sync_jobs')._trigger()
+        return job
+
+    def action_open(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Flatchr synchronisation'),
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+        }
+
+    def report_progress(self, **vals):
+        """Save the progress of a running job, it is committed with the chunk being synchronised."""
+        if self:
+            self.write(vals)
+
+    @api.model
+    def fail_stale_jobs(self):
+        """Mark as failed the running jobs whose runner died, e.g. a cron worker killed on its time limit.
+
+        A runner holds the advisory lock of its job for the whole run, a running job whose lock
+        can be taken has no runner anymore.
+        """
+        self.env.cr.execute("SELECT id FROM flatchr_sync_job WHERE state = 'running' FOR UPDATE SKIP LOCKED")
+        for job_id, in self.env.cr.fetchall():
+            self.env.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", [JOB_LOCK_KEY, job_id])
+            if not self.env.cr.fetchone()[0]:
+                continue
+            _logger.warning("******* Tâche de synchronisation Flatchr %s interrompue, marquée en échec" % job_id)
+            self.browse(job_id).write({
+                'state': 'failed',
+                'date_end': fields.Datetime.now(),
+                'error': _("The synchronisation was interrupted before its end."),
+            })
+            self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", [JOB_LOCK_KEY, job_id])
+        self.env.cr.commit()
+
+    @api.model
+    def run_pending_jobs(self):
+        """Run the pending jobs one by one, called by the runner cron."""
+        self.fail_stale_jobs()
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM flatchr_sync_job
+                 WHERE state = 'pending'
+              ORDER BY id
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+            """)
+            row = self.env.cr.fetchone()
+            if not row:
+                return
+
+            job = self.browse(row[0])
+            # The lock is held by the session until the job ends, it survives the commits of the synchronisation
+            self.env.cr.execute("SELECT pg_advisory_lock(%s, %s)", [JOB_LOCK_KEY, job.id])
+            job.write({'state': 'running', 'date_start': fields.Datetime.now(), 'error': False})
+            self.env.cr.commit()
+
+            try:
+                job.run()
+            except Exception:
+                self.env.cr.rollback()
+                _logger.exception("******* Échec de la tâche de synchronisation Flatchr %s" % job.id)
+                job.write({'state': 'failed', 'date_end': fields.Datetime.now(), 'error': traceback.format_exc()})
+            else:
+                job.write({'state': 'done', 'date_end': fields.Datetime.now(), 'progress': 100})
+            self.env.cr.commit()
+            self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", [JOB_LOCK_KEY, job.id])
+
+    def run(self):
+        self.ensure_one()
+        self.env['hr.job'].fetch_flatchr_data(full_sync=self.job_type == 'full_sync', sync_job=self, account=self.account_id,
+                                              dry_run=self.job_type == 'dry_run')
+        if self.job_type == 'cv_import' and self.csv_file:
+            self.env['hr.applicant'].import_cvs(self.env, self.csv_file)
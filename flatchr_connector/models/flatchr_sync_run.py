@@ -0,0 +1,114 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from odoo import fields, models
+import psutil
+import time
+
+# stage name: field storing its duration
+SYNC_STAGES = {
+    'feed': 'time_feed',
+    'vacancy_parse': 'time_vacancy_parse',
+    'applicant_search': 'time_applicant_search',
+    'detail_fetch': 'time_detail_fetch',
+    'upsert': 'time_upsert',
+    'commit': 'time_commit',
+}
+
+SYNC_COUNTERS = (
+    'vacancies_created', 'vacancies_updated', 'vacancies_skipped', 'vacancies_closed',
+    'applicants_created', 'applicants_updated', 'applicants_skipped', 'applicants_failed',
+    'applicants_quarantined',
+)
+
+
+class FlatchrSyncRun(models.Model):
+    _name = 'flatchr.sync.run'
+    _description = 'Flatchr synchronisation run'
+    _order = 'date_start desc, id desc'
+    _rec_name = 'date_start'
+
+    date_start = fields.Datetime("Start date", required=True, default=fields.Datetime.now, readonly=True)
+    date_end = fields.Datetime("End date", readonly=True)
+    duration = fields.Float("Duration (s)", readonly=True, group_operator="avg")
+    state = fields.Selection([
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ], "State", required=True, default="running", readonly=True)
+    full_sync = fields.Boolean("Full synchronisation", readonly=True)
+    dry_run = fields.Boolean("Dry run", readonly=True, help="Nothing was written, see the report for what the run would have done")
+    diff_report = fields.Binary("Dry run report", attachment=True, readonly=True)
+    diff_report_name = fields.Char("Dry run report name", readonly=True)
+    job_id = fields.Many2one("flatchr.sync.job", string="Job", readonly=True, ondelete="set null")
+    account_id = fields.Many2one("flatchr.account", string="Account", readonly=True, ondelete="set null")
+    error = fields.Text("Error", readonly=True)
+
+    time_feed = fields.Float("Feed download (s)", readonly=True, group_operator="avg")
+    time_vacancy_parse = fields.Float("Vacancy parse (s)", readonly=True, group_operator="avg")
+    time_applicant_search = fields.Float("Applicant search (s)", readonly=True, group_operator="avg")
+    time_detail_fetch = fields.Float("Detail fetch (s)", readonly=True, group_operator="avg")
+    time_upsert = fields.Float("Upsert (s)", readonly=True, group_operator="avg")
+    time_commit = fields.Float("Commit (s)", readonly=True, group_operator="avg")
+
+    vacancies_created = fields.Integer("Vacancies created", readonly=True)
+    vacancies_updated = fields.Integer("Vacancies updated", readonly=True)
+    vacancies_skipped = fields.Integer("Vacancies skipped", readonly=True)
+    vacancies_closed = fields.Integer("Vacancies closed", readonly=True, help="Vacancies no longer published in the careers feed")
+    applicants_created = fields.Integer("Applicants created", readonly=True)
+    applicants_updated = fields.Integer("Applicants updated", readonly=True)
+    applicants_skipped = fields.Integer("Applicants skipped", readonly=True)
+    applicants_failed = fields.Integer("Applicants failed", readonly=True)
+    applicants_quarantined = fields.Integer("Applicants quarantined", readonly=True)
+
+    query_count = fields.Integer("SQL queries", readonly=True)
+    peak_memory = fields.Float("Peak memory (MB)", readonly=True, group_operator="max",
+                               help="Highest resident memory of the worker sampled during the run")
+
+
+class SyncRunRecorder(object):
+    """Collect the timings and counters of a synchronisation in memory and save them on its flatchr.sync.run."""
+
+    def __init__(self, run):
+        self.run = run
+        self.timings = defaultdict(float)
+        self.counts = Counter()
+        self.start = time.monotonic()
+        self.start_queries = run.env.cr.sql_log_count
+        self.process = psutil.Process()
+        self.peak_memory = 0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.monotonic() - start
+
+    def sample_memory(self):
+        self.peak_memory = max(self.peak_memory, self.process.memory_info().rss)
+
+    def get_vals(self):
+        self.sample_memory()
+        vals = {field: self.timings[stage] for stage, field in SYNC_STAGES.items()}
+        vals.update({counter: self.counts[counter] for counter in SYNC_COUNTERS})
+        vals.update(
+            duration=time.monotonic() - self.start,
+            query_count=self.run.env.cr.sql_log_count - self.start_queries,
+            peak_memory=self.peak_memory / 1024 / 1024,
+        )
+        return vals
+
+    def flush(self):
+        """Save the current figures, they are committed with the chunk being synchronised."""
+        self.run.write(self.get_vals())
+
+    def done(self):
+        self.run.write(dict(self.get_vals(), state='done', date_end=fields.Datetime.now()))
+
+    def failed(self, error):
+        self.run.write(dict(self.get_vals(), state='failed', date_end=fields.Datetime.now(), error=error))
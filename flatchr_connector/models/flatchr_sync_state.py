@@ -0,0 +1,124 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from datetime import datetime
+from odoo import api, fields, models
+
+
+class FlatchrSyncState(models.Model):
+    _name = 'flatchr.sync.state'
+    _description = 'Flatchr synchronisation state'
+
+    name = fields.Char("Name", required=True)
+    account_id = fields.Many2one("flatchr.account", string="Account", ondelete="cascade", readonly=True,
+                                 help="Flatchr account synchronised, the global settings are used when empty")
+    last_sync_date = fields.Datetime("Last synchronisation date", readonly=True)
+    last_full_sync_date = fields.Datetime("Last full synchronisation date", readonly=True)
+    watermark_date = fields.Datetime("Last applicant date", readonly=True,
+                                     help="Creation date of the most recent applicant imported from Flatchr")
+    watermark_applicant_id = fields.Char("Last applicant ID", readonly=True,
+                                         help="Flatchr ID of the most recent applicant imported from Flatchr")
+    feed_etag = fields.Char("Careers feed ETag", readonly=True)
+    feed_last_modified = fields.Char("Careers feed Last-Modified", readonly=True)
+    feed_hash = fields.Char("Careers feed hash", readonly=True, help="SHA-256 of the last careers feed parsed")
+    checkpoint_start = fields.Datetime("Checkpoint search start", readonly=True,
+                                       help="Start of the applicants search of the interrupted synchronisation")
+    checkpoint_offset = fields.Integer("Checkpoint offset", readonly=True,
+                                       help="Number of applicants of the search read by the interrupted synchronisation")
+    checkpoint_full_sync = fields.Boolean("Checkpoint full synchronisation", readonly=True)
+    checkpoint_watermark_date = fields.Datetime("Checkpoint applicant date", readonly=True)
+    checkpoint_watermark_applicant_id = fields.Char("Checkpoint applicant ID", readonly=True)
+
+    _sql_constraints = [
+        ('name_uniq', 'unique (name)', "Synchronisation state already exists !"),
+    ]
+
+    @api.model
+    def get_state(self, account=None):
+        """Return the state of `account` (a flatchr.account), or the one of the global settings."""
+        if account:
+            state = self.search([('account_id', '=', account.id)], limit=1)
+            return state or self.create({'name': 'account-%s' % account.id, 'account_id': account.id})
+        state = self.env.ref('flatchr_connector.flatchr_sync_state_default', raise_if_not_found=False)
+        if not state:
+            state = self.create({'name': 'default'})
+        return state
+
+    @staticmethod
+    def get_applicant_key(applicant: dict):
+        """Return the (creation date, Flatchr ID) pair saved as watermark.
+
+        Only the day orders the applicants: the Flatchr IDs are not sequential.
+        """
+        return datetime.strptime(applicant['created_at'], "%d/%m/%y"), str(applicant['applicant'])
+
+    def get_watermark(self):
+        self.ensure_one()
+        if not self.watermark_date:
+            return False
+        return self.watermark_date, self.watermark_applicant_id or ''
+
+    def set_watermark(self, watermark, full_sync=False):
+        """Save the watermark of a completed synchronisation and drop its checkpoint."""
+        self.ensure_one()
+        vals = dict(self._get_checkpoint_reset_vals(), last_sync_date=fields.Datetime.now())
+        if watermark:
+            vals.update(watermark_date=watermark[0], watermark_applicant_id=watermark[1])
+        if full_sync:
+            vals['last_full_sync_date'] = vals['last_sync_date']
+        self.write(vals)
+
+    def get_checkpoint(self):
+        """Return the position of the interrupted synchronisation as a dict, or False if the last one completed."""
+        self.ensure_one()
+        if not self.checkpoint_start:
+            return False
+        return {
+            'start': self.checkpoint_start,
+            'offset': self.checkpoint_offset,
+            'full_sync': self.checkpoint_full_sync,
+            'watermark': self.checkpoint_watermark_date and (self.checkpoint_watermark_date, self.checkpoint_watermark_applicant_id or ''),
+        }
+
+    def set_checkpoint(self, start, offset, full_sync, watermark):
+        """Save the position reached in the applicants search, it is committed with the chunk being synchronised."""
+        self.ensure_one()
+        self.write({
+            'checkpoint_start': start,
+            'checkpoint_offset': offset,
+            'checkpoint_full_sync': full_sync,
+            'checkpoint_watermark_date': watermark and watermark[0],
+            'checkpoint_watermark_applicant_id': watermark and watermark[1],
+        })
+
+    @staticmethod
+    def _get_checkpoint_reset_vals():
+        return {
+            'checkpoint_start': False,
+            'checkpoint_offset': 0,
+            'checkpoint_full_sync': False,
+            'checkpoint_watermark_date': False,
+            'checkpoint_watermark_applicant_id': False,
+        }
+
+    def get_feed_headers(self):
+        """Return the headers making the careers feed request conditional on the last feed parsed."""
+        self.ensure_one()
+        headers = {}
+        if self.feed_etag:
+            headers['If-None-Match'] = self.feed_etag
+        if self.feed_last_modified:
+            headers['If-Modified-Since'] = self.feed_last_modified
+        return headers
+
+    def set_feed_cache(self, response, feed_hash):
+        self.ensure_one()
+        self.write({
+            'feed_etag': response.headers.get('ETag', False),
+            'feed_last_modified': response.headers.get('Last-Modified', False),
+            'feed_hash': feed_hash,
+        })
+
+    def reset_watermark(self):
+        self.write(dict(self._get_checkpoint_reset_vals(), watermark_date=False, watermark_applicant_id=False))
@@ -0,0 +1,131 @@
+# Copyright 2022 ELITE Advanced technologies.
+# Copyright 2022 ELITE - Salim ROUMILI
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models
+import hashlib
+import hmac
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+EVENT_BATCH_SIZE = 50
+EVENT_MAX_ATTEMPTS = 3
+
+
+class FlatchrWebhookEvent(models.Model):
+    """Inbox of the events pushed by Flatchr, processed in small batches by a frequent cron.
+
+    An event is a JSON object {"id": ..., "type": "applicant.created", "data": {...}}: the data of an
+    applicant event is the applicant as returned by the applicants search, optionally with its
+    "vacancy_id", the data of a vacancy event is the vacancy as published in the careers feed.
+    """
+    _name = 'flatchr.webhook.event'
+    _description = 'Flatchr webhook event'
+    _order = 'id desc'
+    _rec_name = 'event_type'
+
+    event_id = fields.Char("Event ID", required=True, readonly=True)
+    event_type = fields.Char("Type", required=True, readonly=True)
+    payload = fields.Text("Payload", readonly=True)
+    state = fields.Selection([
+        ("pending", "Pending"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ], "State", required=True, default="pending", readonly=True)
+    attempts = fields.Integer("Attempts", readonly=True)
+    error = fields.Text("Error", readonly=True)
+    date_processed = fields.Datetime("Processing date", readonly=True)
+
+    _sql_constraints = [
+        ('event_id_uniq', 'unique (event_id)', "Flatchr event already received !"),
+    ]
+
+    @api.model
+    def check_signature(self, body, signature):
+        """Check the hex HMAC-SHA256 of the request `body` computed with the webhook secret."""
+        secret = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.webhook_secret')
+        if not secret or not signature:
+            return False
+        expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature.split('=', 1)[-1].strip().lower())
+
+    @api.model
+    def receive(self, body):
+        """Store the events of a webhook request, the events already received are ignored. Return the new events."""
+        events = json.loads(body)
+        if isinstance(events, dict):
+            events = [events]
+        event_ids = [str(event['id']) for event in events]
+        known = set(self.search([('event_id', 'in', event_ids)]).mapped('event_id'))
+        new_vals = {}
+        for event_id, event in zip(event_ids, events):
+            if event_id not in known:
+                new_vals[event_id] = {'event_id': event_id, 'event_type': event['type'], 'payload': json.dumps(event.get('data') or {})}
+        records = self.create(list(new_vals.values()))
+        if records:
+            self.env.ref('flatchr_connector.cron_process_flatchr_webhook_events')._trigger()
+        return records
+
+    @api.model
+    def process_pending_events(self, batch_size=EVENT_BATCH_SIZE):
+        """Process the pending events batch by batch, called by the inbox cron."""
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM flatchr_webhook_event
+                 WHERE state = 'pending'
+              ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, [batch_size])
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                return
+            self.browse(ids).process()
+            self.env.cr.commit()
+
+    def process(self):
+        """Upsert the vacancies then the applicants carried by the events, a failing batch is retried later."""
+        vacancy_events = self.filtered(lambda event: event.event_type.startswith('vacancy'))
+        applicant_events = self.filtered(lambda event: event.event_type.startswith('applicant'))
+        (self - vacancy_events - applicant_events).write({'state': 'done', 'date_processed': fields.Datetime.now()})
+        for events, method in ((vacancy_events, '_process_vacancies'), (applicant_events, '_process_applicants')):
+            if not events:
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    getattr(events, method)()
+            except Exception as e:
+                _logger.warning("******* Échec du traitement des évènements Flatchr %s : %s" % (events.ids, e))
+                for event in events:
+                    event.write({
+                        'attempts': event.attempts + 1,
+                        'state': 'pending' if event.attempts + 1 < EVENT_MAX_ATTEMPTS else 'failed',
+                        'error': str(e),
+                    })
+            else:
+                events.write({'state': 'done', 'date_processed': fields.Datetime.now(), 'error': False})
+
+    def _process_vacancies(self):
+        # The last event of a vacancy carries its latest version
+        vacancies = {}
+        for event in self.sorted('id'):
+            vacancy = json.loads(event.payload)
+            vacancies[str(vacancy['id'])] = vacancy
+        self.env['hr.job'].upsert_vacancies(list(vacancies.values()))
+
+    def _process_applicants(self):
+        applicants = {}
+        for event in self.sorted('id'):
+            applicant = json.loads(event.payload)
+            applicants[str(applicant['applicant'])] = applicant
+
+        vacancy_by_applicant = {applicant['applicant']: applicant.get('vacancy_id') for applicant in applicants.values()}
+        missing = [flatchr_id for flatchr_id, vacancy_id in vacancy_by_applicant.items() if not vacancy_id]
+        if missing:
+            config = self.env['hr.job'].get_flatchr_config()
+            with self.env['hr.job'].get_flatchr_client(pool_size=config['sync_workers']) as client:
+                vacancy_by_applicant.update(self.env['hr.job'].fetch_applicant_vacancies(
+                    client, config['company_key'], missing, config['sync_workers']))
+        self.env['hr.job'].upsert_applicant_chunk(list(applicants.values()), vacancy_by_applicant)
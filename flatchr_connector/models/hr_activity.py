@@ -10,7 +10,7 @@ class HrActivity(models.Model):
     _description = 'HR activity'
 
     name = fields.Char("Activity")
-    flatchr_id = fields.Integer("Flatchr ID")
+    flatchr_id = fields.Integer("Flatchr ID", copy=False)
 
     _sql_constraints = [
         ('flatchr_id_uniq', 'unique (flatchr_id)', "Activity already exists !"),
@@ -2,22 +2,31 @@
 # Copyright 2022 ELITE - Salim ROUMILI
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from concurrent.futures import ThreadPoolExecutor
 from odoo import fields, api, models, _
 from odoo.exceptions import UserError, ValidationError
 import logging
 import csv
-import urllib
 import base64
 import io
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
 
 _logger = logging.getLogger(__name__)
 
+CV_BATCH_SIZE = 50
+CV_DOWNLOAD_TIMEOUT = 30
+CV_DOWNLOAD_RETRIES = 3
+CV_DOWNLOAD_BACKOFF = 1
+
 
 class HrApplicant(models.Model):
     _inherit = "hr.applicant"
 
     applicant_source = fields.Char(string="Applicant source")
-    flatchr_applicant_id = fields.Char(string="Flatchr Applicant ID")
+    flatchr_applicant_id = fields.Char(string="Flatchr Applicant ID", copy=False)
     job_state = fields.Selection(string="Job state", related="job_id.state", store=True)
     job_count = fields.Integer(compute='_compute_job_count', string="# Jobs")
     date_source = fields.Datetime(string='Date de synchronisation', help="Date à laquelle le candidat a été enregistré dans Odoo via l'API", tracking=True)
@@ -25,6 +34,10 @@ class HrApplicant(models.Model):
     filiere_ids = fields.Many2many("hr.channel", string='Filière', ondelete="restrict", tracking=True)
     metier_ids = fields.Many2many("hr.metier", string='Métiers souhaités', ondelete="restrict", tracking=True)
 
+    _sql_constraints = [
+        ('flatchr_applicant_id_uniq', 'unique (flatchr_applicant_id)', "Flatchr applicant already exists !"),
+    ]
+
     @api.depends('application_count')
     def _compute_job_count(self):
         for applicant in self:
@@ -62,6 +75,41 @@ class HrApplicant(models.Model):
             'context': {'active_test': False}
         }
 
+    @staticmethod
+    def download_cv(session, download_url):
+        """Download a CV, retrying with an exponential backoff.
+
+        Return a (content, attempts, error) tuple, content being False when the download failed.
+        """
+        error = False
+        for attempt in range(1, CV_DOWNLOAD_RETRIES + 1):
+            try:
+                response = session.get(download_url, timeout=CV_DOWNLOAD_TIMEOUT)
+                response.raise_for_status()
+                return response.content, attempt, False
+            except RequestException as e:
+                error = str(e)
+                status = e.response.status_code if e.response is not None else None
+                if status and status < 500 and status != 429:
+                    break  # retrying will not fix a client error
+                if attempt < CV_DOWNLOAD_RETRIES:
+                    time.sleep(CV_DOWNLOAD_BACKOFF * 2 ** (attempt - 1))
+        return False, attempt, error
+
+    @staticmethod
+    def download_first_cv(session, rows):
+        """Try the CSV rows of an applicant in order until a CV is downloaded.
+
+        Return the (row, row key, content, attempts, error) tuple of every row tried.
+        """
+        tried = []
+        for row, row_key in rows:
+            content, attempts, error = HrApplicant.download_cv(session, row[2])
+            tried.append((row, row_key, content, attempts, error))
+            if content:
+                break
+        return tried
+
     @staticmethod
     def import_cvs(env, csv_file):
         file = base64.b64decode(csv_file)
@@ -69,23 +117,61 @@ class HrApplicant(models.Model):
         data.seek(0)
         file_reader = []
         csv_reader = csv.reader(data, delimiter=';')
-        file_reader.extend(csv_reader)
-        
-        for row in file_reader:
-            #row = row[0].replace('"', "")
-            #row = row.split(";")
-
-            applicant_ids = env['hr.applicant'].search([('email_from', '=', row[1])]).filtered(lambda j: j.job_id.name == row[3])
-
-            for applicant_id in applicant_ids:
-                if not applicant_id.has_cv():
-                    download_url = row[2]
-
-                    try:
-                        pdf_file = urllib.request.urlopen(download_url).read()
-
-                        env['ir.attachment'].create({
-                            'name': 'cv_' + applicant_id.partner_name,
+        file_reader.extend(row for row in csv_reader if len(row) > 3)
+
+        # Rows already imported by a previous run are skipped
+        cv_import_lines = env['flatchr.cv.import.line']
+        row_keys = [cv_import_lines.get_row_key(row) for row in file_reader]
+        done_keys = cv_import_lines.get_done_keys(set(row_keys))
+
+        # Candidates are matched on (email, job name) with a single search over all the emails of the file
+        applicants_by_row = {}
+        for applicant_id in env['hr.applicant'].search([('email_from', 'in', list({row[1] for row in file_reader}))]):
+            applicants_by_row.setdefault((applicant_id.email_from, applicant_id.job_id.name), env['hr.applicant'])
+            applicants_by_row[(applicant_id.email_from, applicant_id.job_id.name)] += applicant_id
+        applicants_with_cv = env['hr.applicant'].browse(
+            {applicant_id.id for applicant_ids in applicants_by_row.values() for applicant_id in applicant_ids}
+        ).get_applicants_with_cv()
+
+        # One CV per applicant, as when has_cv() was checked row by row: its rows are tried in order until one succeeds
+        downloads = {}
+        for row, row_key in zip(file_reader, row_keys):
+            for applicant_id in applicants_by_row.get((row[1], row[3]), []):
+                if (row_key, applicant_id.id) not in done_keys and applicant_id.id not in applicants_with_cv:
+                    downloads.setdefault(applicant_id.id, (applicant_id, []))[1].append((row, row_key))
+        downloads = list(downloads.values())
+
+        # CVs are downloaded in parallel and saved by committed batches
+        max_workers = int(env['ir.config_parameter'].sudo().get_param('flatchr_connector.sync_workers', 8))
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_maxsize=max_workers))
+        session.mount('http://', HTTPAdapter(pool_maxsize=max_workers))
+        stages = {}
+        with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for index in range(0, len(downloads), CV_BATCH_SIZE):
+                batch = downloads[index:index + CV_BATCH_SIZE]
+                tried_rows = executor.map(lambda download: HrApplicant.download_first_cv(session, download[1]), batch)
+                attachment_vals = []
+                results = []
+
+                for (applicant_id, rows), tried in zip(batch, tried_rows):
+                    for row, row_key, pdf_file, attempts, error in tried:
+                        result = {
+                            'row_key': row_key,
+                            'applicant_id': applicant_id.id,
+                            'download_url': row[2],
+                            'state': 'done' if pdf_file else 'failed',
+                            'attempts': attempts,
+                            'error': error,
+                        }
+                        results.append(result)
+
+                        if not pdf_file:
+                            _logger.error("Impossible de télécharger le CV du candidat: %s, pour la raison suivante : %s" %(applicant_id.name, error))
+                            continue
+
+                        attachment_vals.append({
+                            'name': 'cv_' + (applicant_id.partner_name or ''),
                             'res_id': applicant_id.id,
                             'res_model': applicant_id._name,
                             'datas': base64.encodebytes(pdf_file),
@@ -94,23 +180,32 @@ class HrApplicant(models.Model):
                         })
 
                         if len(row) > 4:
-
-                            applicant_id.stage_id = env['hr.recruitment.stage'].search([('name', '=', row[4].strip())], limit=1)
-
-                    except Exception as e:
-                        _logger.error("Impossible de télécharger le CV du candidat: %s, pour la raison suivante : %s" %(applicant_id.name, e))
+                            stage_name = row[4].strip()
+                            if stage_name not in stages:
+                                stages[stage_name] = env['hr.recruitment.stage'].search([('name', '=', stage_name)], limit=1)
+                            applicant_id.stage_id = stages[stage_name]
+
+                env['ir.attachment'].create(attachment_vals)
+                cv_import_lines.log_results(results)
+                env.cr.commit()
         return True
 
-    def has_cv(self):
-        if not self.partner_name:
-            return False
-
-        attachment_id = self.attachment_ids.filtered(lambda att: 'cv_' + self.partner_name in att.name)
+    def get_applicants_with_cv(self):
+        """Return the ids of the applicants of `self` having a CV attachment, using a single query."""
+        partner_names = {applicant.id: applicant.partner_name for applicant in self if applicant.partner_name}
+        if not partner_names:
+            return set()
 
-        if attachment_id:
-            return True
+        attachments = self.env['ir.attachment'].search_read([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', list(partner_names)),
+            ('name', 'like', 'cv_'),
+        ], ['res_id', 'name'])
+        return {att['res_id'] for att in attachments if 'cv_' + partner_names[att['res_id']] in att['name']}
 
-        return False
+    def has_cv(self):
+        self.ensure_one()
+        return self.id in self.get_applicants_with_cv()
 
     @staticmethod
     def open_dl_wizard(self):
@@ -10,7 +10,7 @@ class HrChannel(models.Model):
     _description = 'HR channel'
 
     name = fields.Char("Channel")
-    flatchr_id = fields.Integer("Flatchr ID")
+    flatchr_id = fields.Integer("Flatchr ID", copy=False)
 
     _sql_constraints = [
         ('flatchr_id_uniq', 'unique (flatchr_id)', "Channel already exists !"),
@@ -10,7 +10,7 @@ class HrContractType(models.Model):
     _description = 'HR contract type'
 
     name = fields.Char("Contract type")
-    flatchr_id = fields.Integer("Flatchr ID")
+    flatchr_id = fields.Integer("Flatchr ID", copy=False)
 
     _sql_constraints = [
         ('flatchr_id_uniq', 'unique (flatchr_id)', "Contract type already exists !"),
@@ -10,7 +10,7 @@ class HrEducationLevel(models.Model):
     _description = 'HR education level'
 
     name = fields.Char("Education level")
-    flatchr_id = fields.Integer("Flatchr ID")
+    flatchr_id = fields.Integer("Flatchr ID", copy=False)
 
     _sql_constraints = [
         ('flatchr_id_uniq', 'unique (flatchr_id)', "Education level already exists !"),
@@ -2,21 +2,52 @@
 # Copyright 2022 ELITE - Salim ROUMILI
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import timedelta
-from odoo import fields, models
+from itertools import islice
+import base64
+import hashlib
+from odoo import _, fields, models
+from odoo.addons.flatchr_connector.lib.flatchr_client import (
+    API_URL,
+    CAREERS_URL,
+    DEFAULT_RATE_LIMIT,
+    FlatchrClient,
+)
+from odoo.addons.flatchr_connector.lib.flatchr_diff import DiffReport
+from odoo.addons.flatchr_connector.models.flatchr_sync_run import SyncRunRecorder
 from odoo.exceptions import UserError, ValidationError
-import requests
-from requests.exceptions import HTTPError
+from psycopg2 import errorcodes
+from requests.exceptions import HTTPError, RequestException
+import json
 import logging
+import psycopg2
+import traceback
 
 _logger = logging.getLogger(__name__)
 
+APPLICANT_CHUNK_SIZE = 200
+UNIQUE_VIOLATION_RETRIES = 3
+DEFAULT_SYNC_WORKERS = 8
+# First key of the advisory locks taken on the accounts being synchronised, the second is 0 for the global settings
+ACCOUNT_LOCK_KEY = 0x466c6174
+REFERENCE_FIELDS = ('contract_type', 'education_level', 'activity', 'channel', 'metier')
+
+
+class FlatchrSyncLocked(UserError):
+    """Raised by lock_flatchr_sync when the synchronisation is already running."""
+
+
+def is_unique_violation(error):
+    return isinstance(error, psycopg2.IntegrityError) and error.pgcode == errorcodes.UNIQUE_VIOLATION
+
 
 class HrJob(models.Model):
     _inherit = 'hr.job'
 
-    flatchr_job_id = fields.Char(string='Flatchr job ID')  # unique ID generated by Flatchr
+    flatchr_job_id = fields.Char(string='Flatchr job ID', copy=False)  # unique ID generated by Flatchr
     reference = fields.Char(string='Reference')
     description = fields.Html(string='Description')
     experience = fields.Integer(string='Experience')
@@ -31,167 +62,719 @@ class HrJob(models.Model):
     remote = fields.Boolean(string='Remote')
     handicap = fields.Boolean(string='Handicap')
     partial = fields.Boolean(string='Partial')
+    flatchr_payload_hash = fields.Char(string='Flatchr payload hash', copy=False)  # hash of the last vacancy imported
+    flatchr_account_id = fields.Many2one("flatchr.account", string='Flatchr account', copy=False, ondelete='set null')  # empty for the global settings
+    flatchr_closed = fields.Boolean(string='Closed by Flatchr', copy=False)  # recruitment stopped because the vacancy left the feed
+
+    _sql_constraints = [
+        ('flatchr_job_id_uniq', 'unique (flatchr_job_id)', "Flatchr job already exists !"),
+    ]
+
+    def resolve_flatchr_references(self, vacancies):
+        """Return a {field name: {flatchr id: odoo id}} dict for the reference tables used by `vacancies`.
+
+        The rows of each table are read with a single query, the missing rows are created in one batch
+        and only the rows whose name changed on Flatchr are written.
+        """
+        references = {}
+        for field_name in REFERENCE_FIELDS:
+            model = self.env['hr.' + field_name.replace('_', '.')].sudo()
+            names = {}
+            for vacancy_dict in vacancies:
+                if vacancy_dict.get(field_name + '_id'):
+                    names[int(vacancy_dict[field_name + '_id'])] = vacancy_dict[field_name]
+
+            existing = {rec['flatchr_id']: rec for rec in model.search_read([('flatchr_id', 'in', list(names))], ['flatchr_id', 'name'])}
+            for flatchr_id, name in names.items():
+                if flatchr_id in existing and existing[flatchr_id]['name'] != name:
+                    model.browse(existing[flatchr_id]['id']).write({'name': name})
+
+            missing = [flatchr_id for flatchr_id in names if flatchr_id not in existing]
+            new_records = model.create([{'flatchr_id': flatchr_id, 'name': names[flatchr_id]} for flatchr_id in missing])
+
+            references[field_name] = {flatchr_id: rec['id'] for flatchr_id, rec in existing.items()}
+            references[field_name].update(zip(missing, new_records.ids))
+        return references
 
     @staticmethod
-    def get_odoo_id(env, field_name, field_value, field_id):
-        model_name = 'hr.' + field_name.replace('_', '.')
-        res_id = env[model_name].search([('flatchr_id', '=', field_id)])
-
-        vals = {
-            'flatchr_id': field_id,
-            'name': field_value
-        }
-
-        if not res_id:
-            res_id = env[model_name].create(vals)
-        else:
-            res_id.write(vals)
+    def get_reference_id(references, field_name, vacancy_dict):
+        flatchr_id = vacancy_dict.get(field_name + '_id')
+        return references[field_name].get(int(flatchr_id), False) if flatchr_id else False
 
-        return res_id.id
-
-    def parse_vacancy(self, vacancy_dict: dict) -> dict:
-        existing_job_id = self.env['hr.job'].search([('flatchr_job_id', '=', vacancy_dict['id'])])
-
-        content_dict = {
-            'flatchr_job_id': vacancy_dict['id'],
+    def prepare_vacancy_vals(self, vacancy_dict: dict, references) -> dict:
+        return {
+            'flatchr_job_id': str(vacancy_dict['id']),
             'name': vacancy_dict['title'],
             'reference': vacancy_dict['reference'],
             'description': vacancy_dict['description'] + vacancy_dict['mission'] + vacancy_dict['profile'],
             'experience': vacancy_dict['experience'],
             'salary': vacancy_dict['salary'],
-            'contract_type_id': self.get_odoo_id(self.env, 'contract_type', vacancy_dict['contract_type'], vacancy_dict['contract_type_id']),
-            'education_level_id': self.get_odoo_id(self.env, 'education_level', vacancy_dict['education_level'], vacancy_dict['education_level_id']),
-            'activity_id': self.get_odoo_id(self.env, 'activity', vacancy_dict['activity'], vacancy_dict['activity_id']),
-            'channel_id': self.get_odoo_id(self.env, 'channel', vacancy_dict['channel'], vacancy_dict['channel_id']),
-            'metier_id': self.get_odoo_id(self.env, 'metier', vacancy_dict['metier'], vacancy_dict['metier_id']),
+            'contract_type_id': self.get_reference_id(references, 'contract_type', vacancy_dict),
+            'education_level_id': self.get_reference_id(references, 'education_level', vacancy_dict),
+            'activity_id': self.get_reference_id(references, 'activity', vacancy_dict),
+            'channel_id': self.get_reference_id(references, 'channel', vacancy_dict),
+            'metier_id': self.get_reference_id(references, 'metier', vacancy_dict),
             'mensuality': vacancy_dict['mensuality'],
             'driver_license': vacancy_dict['driver_license'],
             'remote': vacancy_dict['remote'],
             'handicap': vacancy_dict['handicap'],
             'partial': vacancy_dict['partial'],
             #'state': 'recruit' if vacancy_dict['status'] == 1 else 'open',
+            'flatchr_payload_hash': self.get_payload_hash(vacancy_dict),
         }
 
-        if not existing_job_id:
-            vacancy_id = self.env['hr.job'].create(content_dict)
-        else:
-            vacancy_id = existing_job_id[0]
-            vacancy_id.write(content_dict)
+    @staticmethod
+    def get_payload_hash(payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def set_create_dates(self, model_name, create_dates):
+        """Overwrite the create_date of records with the Flatchr ones, `create_dates` being (id, date) pairs."""
+        if not create_dates:
+            return
+        ids, dates = zip(*create_dates)
+        table = self.env[model_name]._table
+        self.env.cr.execute(f"""
+            UPDATE {table} AS t
+               SET create_date = v.create_date
+              FROM unnest(%s::int[], %s::timestamp[]) AS v(id, create_date)
+             WHERE t.id = v.id
+        """, [list(ids), [str(date) for date in dates]])
+        self.env[model_name].invalidate_cache(['create_date'], list(ids))
+
+    def upsert_vacancies(self, vacancies, references=None, stats=None, account=None):
+        """Create or update the jobs of `vacancies` in batch and return them.
+
+        The jobs whose Flatchr payload did not change since the last import are left untouched,
+        except the jobs closed by close_missing_vacancies which are recruiting again.
+        The reference tables are resolved when `references` is not given.
+        The created, updated and skipped jobs are counted in the `stats` Counter when given.
+        The new jobs are linked to `account` (a flatchr.account) when given.
+        """
+        stats = Counter() if stats is None else stats
+        vacancies_by_flatchr_id = {str(vacancy_dict['id']): vacancy_dict for vacancy_dict in vacancies}
+
+        existing_jobs = {}
+        for job in self.env['hr.job'].search([('flatchr_job_id', 'in', list(vacancies_by_flatchr_id))]):
+            existing_jobs.setdefault(job.flatchr_job_id, job)
+        self.reopen_vacancies(self.env['hr.job'].concat(*existing_jobs.values()))
+
+        vacancy_ids = self.env['hr.job']
+        changed = {}
+        for flatchr_job_id, vacancy_dict in vacancies_by_flatchr_id.items():
+            job = existing_jobs.get(flatchr_job_id)
+            if job and job.flatchr_payload_hash == self.get_payload_hash(vacancy_dict):
+                vacancy_ids += job
+            else:
+                changed[flatchr_job_id] = vacancy_dict
+        stats['vacancies_skipped'] += len(vacancy_ids)
+        if not changed:
+            return vacancy_ids
+
+        if references is None:
+            references = self.resolve_flatchr_references(list(changed.values()))
+
+        new_vals = []
+        for flatchr_job_id, vacancy_dict in changed.items():
+            if flatchr_job_id in existing_jobs:
+                existing_jobs[flatchr_job_id].write(self.prepare_vacancy_vals(vacancy_dict, references))
+                vacancy_ids += existing_jobs[flatchr_job_id]
+                stats['vacancies_updated'] += 1
+            else:
+                new_vals.append(dict(self.prepare_vacancy_vals(vacancy_dict, references), flatchr_account_id=account.id if account else False))
+        vacancy_ids += self.env['hr.job'].create(new_vals)
+        stats['vacancies_created'] += len(new_vals)
+
+        self.set_create_dates('hr.job', [(job.id, changed[job.flatchr_job_id]['created_at'])
+                                         for job in vacancy_ids if job.flatchr_job_id in changed])
+        return vacancy_ids
+
+    def reopen_vacancies(self, jobs):
+        """Start again the recruitment of the `jobs` closed by close_missing_vacancies, back in the careers feed."""
+        closed_jobs = jobs.filtered('flatchr_closed')
+        if closed_jobs:
+            _logger.info("******* %s Annonces Flatchr rouvertes car de retour dans le flux" % len(closed_jobs))
+            closed_jobs.filtered(lambda job: job.state != 'recruit').set_recruit()
+            closed_jobs.write({'flatchr_closed': False})
+        return closed_jobs
+
+    def parse_vacancy(self, vacancy_dict: dict, references=None):
+        return self.upsert_vacancies([vacancy_dict], references)
 
-        self.env.cr.execute("UPDATE hr_job SET create_date = '%s' WHERE id = %s" %(vacancy_dict['created_at'], vacancy_id.id))
+    @staticmethod
+    def get_changed_fields(record, vals):
+        """Return the names of the fields of `vals` whose value differs from the one of `record`."""
+        changed = []
+        for name, value in vals.items():
+            field = record._fields[name]
+            current = record[name]
+            if field.type == 'many2one':
+                current = current.id
+            elif field.type == 'html':
+                current, value = str(current or ''), str(value or '')
+            if (current or False) != (value or False):
+                changed.append(name)
+        return changed
+
+    def diff_flatchr_references(self, vacancies, report):
+        """Read-only counterpart of resolve_flatchr_references: report the reference rows to create or rename
+        and return the references of the existing ones."""
+        references = {}
+        for field_name in REFERENCE_FIELDS:
+            model_name = 'hr.' + field_name.replace('_', '.')
+            names = {}
+            for vacancy_dict in vacancies:
+                if vacancy_dict.get(field_name + '_id'):
+                    names[int(vacancy_dict[field_name + '_id'])] = vacancy_dict[field_name]
+
+            existing = {rec['flatchr_id']: rec for rec in self.env[model_name].sudo().search_read([('flatchr_id', 'in', list(names))], ['flatchr_id', 'name'])}
+            for flatchr_id, name in names.items():
+                if flatchr_id not in existing:
+                    report.add(model_name, flatchr_id, name, 'create')
+                elif existing[flatchr_id]['name'] != name:
+                    report.add(model_name, flatchr_id, name, 'update', ['name'])
+            references[field_name] = {flatchr_id: rec['id'] for flatchr_id, rec in existing.items()}
+        return references
+
+    def diff_vacancies(self, vacancies, report, stats=None):
+        """Report the jobs that upsert_vacancies would create, update or leave unchanged, without writing anything."""
+        stats = Counter() if stats is None else stats
+        vacancies_by_flatchr_id = {str(vacancy_dict['id']): vacancy_dict for vacancy_dict in vacancies}
+        existing_jobs = {}
+        for job in self.env['hr.job'].search([('flatchr_job_id', 'in', list(vacancies_by_flatchr_id))]):
+            existing_jobs.setdefault(job.flatchr_job_id, job)
+
+        changed = {flatchr_job_id: vacancy_dict for flatchr_job_id, vacancy_dict in vacancies_by_flatchr_id.items()
+                   if flatchr_job_id not in existing_jobs
+                   or existing_jobs[flatchr_job_id].flatchr_payload_hash != self.get_payload_hash(vacancy_dict)}
+        references = self.diff_flatchr_references(list(changed.values()), report)
+        for flatchr_job_id, vacancy_dict in vacancies_by_flatchr_id.items():
+            job = existing_jobs.get(flatchr_job_id)
+            if job and job.flatchr_closed and job.state != 'recruit':
+                report.add('hr.job', flatchr_job_id, job.name, 'reopen', ['state'])
+            if flatchr_job_id not in changed:
+                report.add('hr.job', flatchr_job_id, job.name, 'unchanged')
+                stats['vacancies_skipped'] += 1
+            elif not job:
+                report.add('hr.job', flatchr_job_id, vacancy_dict['title'], 'create')
+                stats['vacancies_created'] += 1
+            else:
+                vals = self.prepare_vacancy_vals(vacancy_dict, references)
+                vals.pop('flatchr_payload_hash')
+                changed_fields = self.get_changed_fields(job, vals)
+                report.add('hr.job', flatchr_job_id, job.name, 'update' if changed_fields else 'unchanged', changed_fields)
+                stats['vacancies_updated' if changed_fields else 'vacancies_skipped'] += 1
+
+    def diff_applicants(self, applicants, vacancy_by_applicant, report, stats=None):
+        """Report the partners and applicants that upsert_applicants would create or update, without writing anything.
+
+        The jobs reported as created by the vacancy stage are considered as existing.
+        """
+        stats = Counter() if stats is None else stats
+        flatchr_job_ids = {str(vacancy_id) for vacancy_id in vacancy_by_applicant.values() if vacancy_id}
+        known_job_ids = set(self.env['hr.job'].search([('flatchr_job_id', 'in', list(flatchr_job_ids))]).mapped('flatchr_job_id'))
+        known_job_ids |= report.created['hr.job']
+
+        flatchr_applicant_ids = [str(applicant['applicant']) for applicant in applicants]
+        partners = {}
+        for partner in self.env['res.partner'].with_context(active_test=False).search([('flatchr_applicant_id', 'in', flatchr_applicant_ids)]):
+            partners.setdefault(partner.flatchr_applicant_id, partner)
+        existing_applicants = set(self.env['hr.applicant'].with_context(active_test=False).search(
+            [('flatchr_applicant_id', 'in', flatchr_applicant_ids)]).mapped('flatchr_applicant_id'))
+
+        for applicant in applicants:
+            flatchr_applicant_id = str(applicant['applicant'])
+            vacancy_id = vacancy_by_applicant.get(applicant['applicant'])
+            name = f"{applicant['firstname']} {applicant['lastname']}"
+            if not vacancy_id:
+                report.add('hr.applicant', flatchr_applicant_id, name, 'failed')
+                stats['applicants_failed'] += 1
+                continue
+            if str(vacancy_id) not in known_job_ids:
+                report.add('hr.applicant', flatchr_applicant_id, name, 'skipped')
+                stats['applicants_skipped'] += 1
+                continue
+
+            partner_vals = self.prepare_partner_vals(applicant)
+            changed_fields = []
+            if flatchr_applicant_id in partners:
+                changed_fields = self.get_changed_fields(partners[flatchr_applicant_id], partner_vals)
+                report.add('res.partner', flatchr_applicant_id, partner_vals['name'], 'update' if changed_fields else 'unchanged', changed_fields)
+            elif flatchr_applicant_id not in report.created['res.partner']:
+                report.add('res.partner', flatchr_applicant_id, partner_vals['name'], 'create')
+
+            if flatchr_applicant_id in existing_applicants or flatchr_applicant_id in report.created['hr.applicant']:
+                report.add('hr.applicant', flatchr_applicant_id, name, 'unchanged')
+                stats['applicants_updated' if changed_fields else 'applicants_skipped'] += 1
+            elif not applicant['vacancy']:
+                report.add('hr.applicant', flatchr_applicant_id, name, 'skipped')
+                stats['applicants_skipped'] += 1
+            else:
+                report.add('hr.applicant', flatchr_applicant_id, name, 'create')
+                stats['applicants_created'] += 1
+
+    def drop_imported_applicants(self, applicants, stats=None):
+        """Return `applicants` without those already imported, counted as skipped in `stats`.
+
+        The search is day-based and the Flatchr IDs are not ordered, so the applicants from the
+        watermark day onwards are read again by the next run and checked with a single query.
+        """
+        stats = Counter() if stats is None else stats
+        checked_ids = [str(applicant['applicant']) for applicant in applicants]
+        if not checked_ids:
+            return applicants
+        imported = set(self.env['hr.applicant'].with_context(active_test=False).search(
+            [('flatchr_applicant_id', 'in', checked_ids)]).mapped('flatchr_applicant_id'))
+        stats['applicants_skipped'] += len(imported)
+        return [applicant for applicant in applicants if str(applicant['applicant']) not in imported]
+
+    def get_missing_vacancies(self, flatchr_job_ids, account=None):
+        """Return the recruiting Flatchr jobs of `account` that are no longer published in the careers feed.
+
+        The feed is loaded in a temporary table and diffed with an anti-join, so that the cost does
+        not depend on a NOT IN list of every job.
+        """
+        cr = self.env.cr
+        cr.execute("CREATE TEMP TABLE IF NOT EXISTS flatchr_feed_vacancy (flatchr_job_id varchar PRIMARY KEY) ON COMMIT DROP")
+        cr.execute("TRUNCATE flatchr_feed_vacancy")
+        cr.execute("INSERT INTO flatchr_feed_vacancy SELECT DISTINCT unnest(%s::varchar[])", [list(flatchr_job_ids)])
+        cr.execute("""
+            SELECT j.id
+              FROM hr_job j
+             WHERE j.flatchr_job_id IS NOT NULL
+               AND j.state = 'recruit'
+               AND j.flatchr_account_id IS NOT DISTINCT FROM %s
+               AND NOT EXISTS (SELECT 1 FROM flatchr_feed_vacancy f WHERE f.flatchr_job_id = j.flatchr_job_id)
+        """, [account.id if account else None])
+        return self.env['hr.job'].browse([row[0] for row in cr.fetchall()])
+
+    def close_missing_vacancies(self, flatchr_job_ids, account=None):
+        """Stop the recruitment of the Flatchr jobs of `account` that are no longer published in the careers feed, return them."""
+        closed_jobs = self.get_missing_vacancies(flatchr_job_ids, account)
+        if closed_jobs:
+            _logger.info("******* %s Annonces Flatchr fermées car absentes du flux" % len(closed_jobs))
+            closed_jobs.set_open()
+            closed_jobs.write({'flatchr_closed': True})
+        return closed_jobs
+
+    def get_flatchr_config(self, account=None):
+        """Return the settings of `account` (a flatchr.account), or the global ones of the configuration when not given."""
+        if account:
+            return account.get_config()
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        return {
+            'slug': get_param('flatchr_connector.flatchr_enterprise_slug'),
+            'company_key': get_param('flatchr_connector.flatchr_company_key'),
+            'token': get_param('flatchr_connector.flatchr_token'),
+            'careers_url': get_param('flatchr_connector.careers_url', CAREERS_URL),
+            'api_url': get_param('flatchr_connector.api_url', API_URL),
+            'sync_period': int(get_param('flatchr_connector.sync_period') or 365),
+            'sync_workers': int(get_param('flatchr_connector.sync_workers', DEFAULT_SYNC_WORKERS)),
+            'rate_limit': float(get_param('flatchr_connector.rate_limit', DEFAULT_RATE_LIMIT)),
+        }
 
-        return vacancy_id
+    def get_flatchr_client(self, pool_size=DEFAULT_SYNC_WORKERS, account=None):
+        """Return a FlatchrClient configured from the settings of `account`, to be closed by the caller."""
+        config = self.get_flatchr_config(account)
+        return FlatchrClient(
+            config['token'],
+            careers_url=config['careers_url'],
+            api_url=config['api_url'],
+            pool_size=pool_size,
+            rate_limit=config['rate_limit'],
+        )
 
-    def parse_applicant(self, applicant: dict, vacancy_ids):
-        company_key = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.flatchr_company_key')
-        token = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.flatchr_token')
-        flatchr_candidate_id = applicant['applicant']
-        url = f'https://api.flatchr.io/company/{company_key}/applicant/{flatchr_candidate_id}?fields=candidate,vacancy,candidate.consent'
-        headers = requests.structures.CaseInsensitiveDict()
-        headers['Authorization'] = f'Bearer {token}'
-        headers['Content-Type'] = 'application/json'
-        response = requests.get(url, headers=headers)
-        job_id = False
+    @staticmethod
+    def fetch_applicant_vacancies(client, company_key, flatchr_applicant_ids, max_workers):
+        """Fetch the applicant details concurrently and return a {flatchr applicant id: flatchr vacancy id} dict.
+
+        Only the HTTP calls run in the worker threads, the records are written by the caller.
+        """
+        def fetch(flatchr_applicant_id):
+            vacancy_id = False
+            try:
+                response = client.get_applicant(company_key, flatchr_applicant_id)
+                if response.status_code == 200:
+                    vacancy_id = response.json()['vacancy_id']
+            except (RequestException, ValueError, KeyError) as e:
+                _logger.warning("Impossible de récupérer le candidat Flatchr %s : %s" % (flatchr_applicant_id, e))
+            return flatchr_applicant_id, vacancy_id
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(flatchr_applicant_ids) or 1))) as executor:
+            return dict(executor.map(fetch, flatchr_applicant_ids))
 
-        if response.status_code  == 200:
-            job_id = vacancy_ids.search([("flatchr_job_id", "=", response.json()['vacancy_id'])], limit=1)
+    @staticmethod
+    def prepare_partner_vals(applicant: dict) -> dict:
+        return {
+            'flatchr_applicant_id': str(applicant['applicant']),
+            'name': f"{applicant['firstname']} {applicant['lastname']} (Flatchr)",
+            'email': applicant['email'],
+            'phone': applicant['phone'],
+        }
 
-        if job_id:
+    def upsert_applicants(self, applicants, vacancy_by_applicant, stats=None):
+        """Create or update the partners and applicants of a page of the Flatchr applicants search.
+
+        Existing records are resolved with one query per model and new ones are created in batch.
+        Return the number of created applicants, the outcome of each applicant is counted in the
+        `stats` Counter when given: failed when its details could not be fetched, skipped when its
+        vacancy is unknown or when it was already imported with an unchanged partner, updated when
+        only its partner changed, created otherwise.
+        """
+        stats = Counter() if stats is None else stats
+        failed = sum(1 for applicant in applicants if not vacancy_by_applicant.get(applicant['applicant']))
+        stats['applicants_failed'] += failed
+        flatchr_job_ids = {str(vacancy_id) for vacancy_id in vacancy_by_applicant.values() if vacancy_id}
+        jobs = {}
+        for job in self.env['hr.job'].search([('flatchr_job_id', 'in', list(flatchr_job_ids))]):
+            jobs.setdefault(job.flatchr_job_id, job)
+
+        count = len(applicants)
+        applicants = [applicant for applicant in applicants
+                      if str(vacancy_by_applicant.get(applicant['applicant']) or '') in jobs]
+        stats['applicants_skipped'] += count - failed - len(applicants)
+        if not applicants:
+            return 0
+        flatchr_applicant_ids = [str(applicant['applicant']) for applicant in applicants]
+
+        partners = {}
+        # The archived partners keep their Flatchr ID, which is unique
+        for partner in self.env['res.partner'].with_context(active_test=False).search([('flatchr_applicant_id', 'in', flatchr_applicant_ids)]):
+            partners.setdefault(partner.flatchr_applicant_id, partner)
+
+        new_partner_vals = {}
+        updated_partners = set()
+        for applicant in applicants:
+            content_dict = self.prepare_partner_vals(applicant)
+            partner = partners.get(content_dict['flatchr_applicant_id'])
+            if partner:
+                # Only the partners changed on Flatchr are written
+                changed_fields = self.get_changed_fields(partner, content_dict)
+                if changed_fields:
+                    partner.write({name: content_dict[name] for name in changed_fields})
+                    updated_partners.add(content_dict['flatchr_applicant_id'])
+            else:
+                new_partner_vals[content_dict['flatchr_applicant_id']] = content_dict
+        for partner in self.env['res.partner'].create(list(new_partner_vals.values())):
+            partners[partner.flatchr_applicant_id] = partner
+
+        # Then we can take care of the hr_applicant
+        existing_applicants = set(self.env['hr.applicant'].with_context(active_test=False).search(
+            [('flatchr_applicant_id', 'in', flatchr_applicant_ids)]).mapped('flatchr_applicant_id'))
+
+        new_applicant_vals = []
+        create_dates = []
+        for applicant in applicants:
+            flatchr_applicant_id = str(applicant['applicant'])
+            if not applicant['vacancy']:
+                stats['applicants_skipped'] += 1
+                continue
+            if flatchr_applicant_id in existing_applicants:
+                # Only its partner can be updated
+                stats['applicants_updated' if flatchr_applicant_id in updated_partners else 'applicants_skipped'] += 1
+                continue
+            existing_applicants.add(flatchr_applicant_id)
+            job_id = jobs[str(vacancy_by_applicant[applicant['applicant']])]
             content_dict = {
-                'flatchr_applicant_id': applicant['applicant'],
-                'name': f"{applicant['firstname']} {applicant['lastname']} (Flatchr)",
-                'email': applicant['email'],
-                'phone': applicant['phone'],
+                'name': f"{applicant['firstname'].upper()} {applicant['lastname'].upper()}",
+                'partner_name': f"{applicant['firstname'].upper()} {applicant['lastname'].upper()}",
+                'flatchr_applicant_id': flatchr_applicant_id,
+                'date_source': datetime.now(),
+                'partner_id': partners[flatchr_applicant_id].id,
+                'applicant_source': applicant['source'],
+                'job_id': job_id.id,
+
+                'secteur_ids': [(4, job_id.activity_id.id)] if job_id.activity_id else [],
+                'filiere_ids': [(4, job_id.channel_id.id)] if job_id.channel_id else [],
+                'metier_ids': [(4, job_id.metier_id.id)] if job_id.metier_id else [],
             }
-
-            existing_partners = self.env['res.partner'].search([('flatchr_applicant_id', '=', applicant['applicant'])])
-            if not existing_partners:
-                partner_id = self.env['res.partner'].create(content_dict)
-            else:
-                partner_id = existing_partners[0]
-                partner_id.write(content_dict)
-
-            # Then we can take care of the hr_applicant
-            if applicant['vacancy']:
-                content_dict = {
-                    'name': f"{applicant['firstname'].upper()} {applicant['lastname'].upper()}",
-                    'partner_name': f"{applicant['firstname'].upper()} {applicant['lastname'].upper()}",
-                    'flatchr_applicant_id': applicant['applicant'],
-                    'date_source': datetime.now(),
-                    'partner_id': partner_id.id,
-                    'applicant_source': applicant['source'],
-                    'job_id': job_id.id,
-
-                    'secteur_ids': [(4, job_id.activity_id.id)],
-                    'filiere_ids': [(4, job_id.channel_id.id)],
-                    'metier_ids': [(4, job_id.metier_id.id)],
-                }
-
-                existing_applicants = self.env['hr.applicant'].search([('flatchr_applicant_id', '=', applicant['applicant'])])
-
-                if not existing_applicants:
-                    hr_applicant_id = self.env['hr.applicant'].sudo().create(content_dict)
-                    #hr_applicant_id.user_id = False
-
-                    self.env.cr.execute("UPDATE hr_applicant SET create_date = '%s' WHERE id = %s" %(str(datetime.strptime(applicant['created_at'], "%d/%m/%y")), hr_applicant_id.id))
-                #else:
-                #    hr_applicant_id = existing_applicants[0]
-                #    hr_applicant_id.write(content_dict)
-        #else:
-        #    raise ValidationError("Job %s not found !" % applicant['vacancy'])
-
-    def fetch_flatchr_data(self):
+            new_applicant_vals.append(content_dict)
+            create_dates.append(datetime.strptime(applicant['created_at'], "%d/%m/%y"))
+
+        hr_applicant_ids = self.env['hr.applicant'].sudo().create(new_applicant_vals)
+        self.set_create_dates('hr.applicant', list(zip(hr_applicant_ids.ids, create_dates)))
+        stats['applicants_created'] += len(hr_applicant_ids)
+        return len(hr_applicant_ids)
+
+    def parse_applicant(self, applicant: dict, flatchr_vacancy_id):
+        return self.upsert_applicants([applicant], {applicant['applicant']: flatchr_vacancy_id})
+
+    def retry_on_unique_violation(self, func, *args, **kwargs):
+        """Call `func`, rolling back and calling it again when it creates a Flatchr row that already exists.
+
+        The accounts are synchronised concurrently and share the reference tables and the partners.
+        The row created by another account is only visible to a new transaction, so the transaction
+        must not hold anything else than the work of `func` since its last commit.
+        """
+        for attempt in range(1, UNIQUE_VIOLATION_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except psycopg2.IntegrityError as e:
+                if not is_unique_violation(e) or attempt == UNIQUE_VIOLATION_RETRIES:
+                    raise
+                _logger.info("******* Ligne Flatchr créée par une synchronisation concurrente, nouvelle tentative : %s" % e)
+                self.env.cr.rollback()
+
+    def upsert_applicant_chunk(self, applicants, vacancy_by_applicant, stats=None, run=None):
+        """Run upsert_applicants on a chunk inside a savepoint so that a bad record does not abort the synchronisation.
+
+        When the chunk fails, its applicants are imported one by one and those failing again are
+        quarantined in flatchr.applicant.quarantine. The counters of a rolled back attempt are discarded.
+        The unique violations are raised to be retried, see retry_on_unique_violation.
+        """
+        stats = Counter() if stats is None else stats
+        chunk_stats = Counter()
+        try:
+            with self.env.cr.savepoint():
+                self.upsert_applicants(applicants, vacancy_by_applicant, chunk_stats)
+        except Exception as e:
+            if is_unique_violation(e):
+                raise
+            _logger.warning("******* Échec de l'import d'un lot de candidats Flatchr, import candidat par candidat : %s" % e)
+            chunk_stats = Counter()
+            for applicant in applicants:
+                applicant_stats = Counter()
+                vacancy_id = vacancy_by_applicant.get(applicant['applicant'])
+                try:
+                    with self.env.cr.savepoint():
+                        self.upsert_applicants([applicant], {applicant['applicant']: vacancy_id}, applicant_stats)
+                except Exception as e:
+                    if is_unique_violation(e):
+                        raise
+                    _logger.warning("******* Candidat Flatchr %s mis en quarantaine : %s" % (applicant['applicant'], e))
+                    self.env['flatchr.applicant.quarantine'].sudo().quarantine(applicant, vacancy_id, str(e), run)
+                    applicant_stats = Counter(applicants_quarantined=1)
+                chunk_stats.update(applicant_stats)
+        stats.update(chunk_stats)
+        return chunk_stats['applicants_created']
+
+    def check_flatchr_connection(self, account=None):
+        """Probe the careers feed and the applicants API with the saved credentials, raise if one is unreachable."""
+        config = self.get_flatchr_config(account)
+
+        with self.get_flatchr_client(pool_size=1, account=account) as client:
+            try:
+                client.get_feed(config['slug'], method='HEAD').raise_for_status()
+                # An empty window only checks the credentials of the API
+                client.search_applicants(config['company_key'], {'start': str(datetime.now()), 'end': str(datetime.now())}).raise_for_status()
+            except RequestException as e:
+                raise ValidationError('HTTP error occurred: %s' % e)
+        return True
+
+    def lock_flatchr_sync(self, account=None):
+        """Take the session lock of the synchronisation of `account`, or of the global settings when not given.
+
+        The lock survives the commits of the synchronisation, so that two synchronisations never
+        write the same sync state at once. A FlatchrSyncLocked is raised when it is already held.
+        """
+        self.env.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", [ACCOUNT_LOCK_KEY, account.id if account else 0])
+        if not self.env.cr.fetchone()[0]:
+            raise FlatchrSyncLocked(_("A synchronisation of %s is already running.") % (account.name if account else _("the Flatchr settings")))
+
+    def unlock_flatchr_sync(self, account=None):
+        self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", [ACCOUNT_LOCK_KEY, account.id if account else 0])
+
+    def fetch_flatchr_data(self, full_sync=False, sync_job=None, account=None, dry_run=False):
+        """Synchronise the vacancies and applicants from Flatchr.
+
+        Only the applicants newer than the watermark of the sync state are imported, unless
+        `full_sync` is set or no watermark was recorded yet: the whole `sync_period` is then fetched.
+        The progress is reported on `sync_job` (a flatchr.sync.job) when given.
+        The timings and counters of the run are journaled in a flatchr.sync.run, which is returned.
+        When `account` (a flatchr.account) is given, its settings and watermark are used and the
+        records are created in its company, otherwise the global settings of the configuration.
+        With `dry_run`, nothing but the run is written: the run gets a CSV report of the jobs,
+        partners and applicants that would be created, updated or left unchanged.
+        A FlatchrSyncLocked is raised when the account is already being synchronised.
+        """
+        if account:
+            self = self.with_company(account.company_id)
+        # A dry run leaves the sync state untouched, it may run along a synchronisation
+        if not dry_run:
+            self.lock_flatchr_sync(account)
+        try:
+            sync_job = sync_job or self.env['flatchr.sync.job']
+            date_start = datetime.now()
+            _logger.info("******* Début de la synchronisation Flatchr %s %s" % (account.name if account else '', date_start))
+
+            config = self.get_flatchr_config(account)
+            max_workers = config['sync_workers']
+            sync_state = self.env['flatchr.sync.state'].sudo().get_state(account)
+            # The run is committed first so that it is kept when the synchronisation fails
+            recorder = SyncRunRecorder(self.env['flatchr.sync.run'].sudo().create({
+                'full_sync': full_sync,
+                'job_id': sync_job.id,
+                'account_id': account.id if account else False,
+                'dry_run': dry_run,
+            }))
+            report = DiffReport() if dry_run else None
+            self.env.cr.commit()
+            client = self.get_flatchr_client(pool_size=max_workers, account=account)
+            try:
+                i, j = self._fetch_flatchr_data(client, config['slug'], config['company_key'], config['sync_period'],
+                                                sync_state, full_sync, sync_job, max_workers, recorder, report)
+            except Exception:
+                self.env.cr.rollback()
+                recorder.failed(traceback.format_exc())
+                self.env.cr.commit()
+                raise
+            finally:
+                client.close()
+            client.log_metrics()
+            recorder.done()
+            if dry_run:
+                recorder.run.write({
+                    'diff_report': base64.b64encode(report.to_csv()),
+                    'diff_report_name': 'flatchr_dry_run_%s.csv' % recorder.run.id,
+                })
+                _logger.info("******* Simulation Flatchr terminée : %s" % dict(report.counts()))
+                return recorder.run
+
+            if not account:
+                self.env['ir.config_parameter'].sudo().set_param('flatchr_connector.last_sync_date', datetime.now().date())
+            _logger.info("******* Fin de la synchronisation Flatchr %s" % datetime.now())
+            _logger.info("******* %s Annonces et %s Candidats synchronisés en %s" % (i, j, datetime.now() - date_start))
+            return recorder.run
+        finally:
+            if not dry_run:
+                self.unlock_flatchr_sync(account)
+
+    def _fetch_flatchr_data(self, client, slug, company_key, sync_period, sync_state, full_sync, sync_job, max_workers, recorder, report=None):
+        """Run the vacancy and applicant stages of fetch_flatchr_data, return the number of vacancies and applicants.
+
+        Each stage is timed on `recorder`, a SyncRunRecorder. When `report` (a DiffReport) is given,
+        the records are diffed into it instead of being written and the sync state is left untouched.
+        """
         date_start = datetime.now()
-        _logger.info("******* Début de la synchronisation Flatchr %s" % date_start)
-
-        slug = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.flatchr_enterprise_slug')
-        api_key = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.flatchr_api_key')
-        token = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.flatchr_token')
-        company_key = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.flatchr_company_key')
-        last_sync_date = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.last_sync_date')
-        sync_period = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.sync_period')
-        # Retrieve and parse jobs
-        headers = requests.structures.CaseInsensitiveDict()
-        headers['Authorization'] = f'Bearer {token}'
-        headers['Content-Type'] = 'application/json'
 
-        vacancy_ids = self.env['hr.job']  # Those silly goobers don't know how to reference records properly using ids, so I have to identify them DIY-style using a title.
+        # Retrieve and parse jobs
         try:
-            response = requests.get(f'https://careers.flatchr.io/company/{slug}.json', headers={'Accept': '*/*', 'Authorization': f'Bearer {token}'})
-            response.raise_for_status()
+            with recorder.stage('feed'):
+                response = client.get_feed(slug, headers=None if full_sync else sync_state.get_feed_headers())
+                response.raise_for_status()
 
         except HTTPError as http_err:
             raise ValidationError('HTTP error occurred: %s' %http_err)
 
-        i = 0
-        for vacancy in response.json()['items']:
-            if vacancy['vacancy']:
-                vacancy_ids += self.parse_vacancy(vacancy['vacancy'])
-                i = i + 1
-
-        archived_vacancy_ids = self.env['hr.job'].search([('state', 'not in', ['open']),('id', 'not in', vacancy_ids.ids)])
-        #for vacancy_id in archived_vacancy_ids:
-        #    vacancy_id.active_ela = False
+        feed_hash = response.status_code != 304 and hashlib.sha256(response.content).hexdigest()
+        if not feed_hash or (not full_sync and feed_hash == sync_state.feed_hash):
+            _logger.info("******* Annonces Flatchr inchangées depuis la dernière synchronisation")
+            i = 0
+        else:
+            with recorder.stage('vacancy_parse'):
+                vacancies = [vacancy['vacancy'] for vacancy in response.json()['items'] if vacancy['vacancy']]
+                i = len(vacancies)
+                flatchr_job_ids = [str(vacancy['id']) for vacancy in vacancies]
+                # An empty feed is more likely an outage on Flatchr's side than the end of every vacancy
+                if report is not None:
+                    self.diff_vacancies(vacancies, report, stats=recorder.counts)
+                    closed_jobs = self.get_missing_vacancies(flatchr_job_ids, account=sync_state.account_id) if vacancies else []
+                    for job in closed_jobs:
+                        report.add('hr.job', job.flatchr_job_id, job.name, 'close', ['state'])
+                else:
+                    def upsert_feed():
+                        # The counters of a rolled back attempt are discarded
+                        vacancy_stats = Counter()
+                        # The reference tables are only resolved for the vacancies that changed
+                        self.upsert_vacancies(vacancies, stats=vacancy_stats, account=sync_state.account_id)
+                        closed_jobs = self.close_missing_vacancies(flatchr_job_ids, account=sync_state.account_id) if vacancies else []
+                        sync_state.set_feed_cache(response, feed_hash)
+                        return vacancy_stats, closed_jobs
+
+                    vacancy_stats, closed_jobs = self.retry_on_unique_violation(upsert_feed)
+                    recorder.counts.update(vacancy_stats)
+                recorder.counts['vacancies_closed'] += len(closed_jobs)
+        sync_job.report_progress(vacancies_done=i, progress=10)
+        recorder.flush()
+        if report is None:
+            # A retried applicant chunk rolls back to this point
+            self.env.cr.commit()
 
         # Retrieve and parse applicants
-        url = f'https://api.flatchr.io/company/{company_key}/search/applicants?fields=candidate,vacancy,candidate.consent'
-        start_from = datetime.strptime(last_sync_date, '%Y-%m-%d') - timedelta(days=int(sync_period))
-        #end_from = datetime.strptime(last_sync_date, '%Y-%m-%d')
-        #data = f'{{"start": "{start_from}", "end":"{end_from}"}}'
-        data = f'{{"start": "{start_from}"}}'
-
-        response = requests.post(url, headers=headers, data=data)
-        
+        # An interrupted run is resumed from its last committed chunk, unless a full synchronisation replaces it
+        checkpoint = sync_state.get_checkpoint()
+        if checkpoint and (checkpoint['full_sync'] or not full_sync):
+            full_sync = checkpoint['full_sync']
+        else:
+            checkpoint = False
+        watermark = False if full_sync else sync_state.get_watermark()
+        if checkpoint:
+            start_from = checkpoint['start']
+        elif watermark:
+            start_from = watermark[0]
+        else:
+            full_sync = True
+            start_from = date_start.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=sync_period)
+        # Number of applicants committed by the interrupted run, only reported
+        offset = checkpoint['offset'] if checkpoint else 0
+        _logger.info("******* Synchronisation %s des candidats Flatchr depuis %s" % ('complète' if full_sync else 'incrémentale', start_from))
+        if checkpoint:
+            _logger.info("******* Reprise de la synchronisation interrompue après %s candidats" % offset)
+
+        # Applicant details are fetched concurrently chunk by chunk, then written on this thread
+        new_watermark = checkpoint['watermark'] if checkpoint else watermark
+        # The watermark does not pass the oldest applicant whose details could not be fetched, so that the next run retries it.
+        # A resumed run reads its whole window again, the checkpoint keeps the uncapped watermark.
+        watermark_cap = False
+        retry_from = date_start.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=sync_period)
         j = 0
-        for applicant in response.json():
-            self.parse_applicant(applicant, vacancy_ids)
-            j = j + 1
-            if j % 200 == 0:
+        # The search result is streamed so that the memory use does not depend on the size of the window
+        with recorder.stage('applicant_search'):
+            response = client.search_applicants(company_key, {'start': str(start_from)}, stream=True)
+            response.raise_for_status()
+        content_length = int(response.headers.get('Content-Length') or 0)
+        applicants = client.iter_applicants(response)
+        if watermark:
+            # The search is day-based, drop the days imported by the previous runs, the watermark day is read again
+            applicants = (applicant for applicant in applicants if sync_state.get_applicant_key(applicant)[0] >= watermark[0])
+
+        def next_chunk():
+            # Reading the stream is part of the search stage
+            with recorder.stage('applicant_search'):
+                return list(islice(applicants, APPLICANT_CHUNK_SIZE))
+
+        for chunk in iter(next_chunk, []):
+            chunk_watermark = max(sync_state.get_applicant_key(applicant) for applicant in chunk)
+            new_watermark = max(new_watermark, chunk_watermark) if new_watermark else chunk_watermark
+            j = j + len(chunk)
+            if checkpoint or watermark:
+                # The search result changes between runs, the applicants committed before the interruption
+                # are identified by their import rather than by their position in the stream, and the days
+                # after a watermark held back by a failed detail fetch can be imported already
+                chunk = self.drop_imported_applicants(chunk, stats=recorder.counts)
+            with recorder.stage('detail_fetch'):
+                vacancy_by_applicant = self.fetch_applicant_vacancies(
+                    client, company_key, [applicant['applicant'] for applicant in chunk], max_workers)
+            if report is not None:
+                with recorder.stage('upsert'):
+                    self.diff_applicants(chunk, vacancy_by_applicant, report, stats=recorder.counts)
+                sync_job.report_progress(applicants_done=j)
+                continue
+            with recorder.stage('upsert'):
+                self.retry_on_unique_violation(
+                    self.upsert_applicant_chunk, chunk, vacancy_by_applicant, stats=recorder.counts, run=recorder.run)
+            # Only a failed detail fetch is retried: an applicant of a vacancy missing from the feed stays so,
+            # and for the `sync_period` days a full synchronisation covers, as the rolling window did
+            unresolved_keys = [key for key in (sync_state.get_applicant_key(applicant) for applicant in chunk
+                                               if not vacancy_by_applicant.get(applicant['applicant']))
+                               if key[0] >= retry_from]
+            if unresolved_keys:
+                watermark_cap = min([watermark_cap] + unresolved_keys) if watermark_cap else min(unresolved_keys)
+            with recorder.stage('commit'):
+                if content_length:
+                    # The applicant count is unknown while streaming, the progress is estimated on the bytes read
+                    sync_job.report_progress(applicants_done=j, progress=10 + 90 * min(1.0, response.raw.tell() / content_length))
+                else:
+                    sync_job.report_progress(applicants_done=j)
+                recorder.flush()
+                sync_state.set_checkpoint(start_from, offset + j, full_sync, new_watermark)
                 self.env.cr.commit()
 
-        self.env['ir.config_parameter'].sudo().set_param('flatchr_connector.last_sync_date', datetime.now().date())
-        _logger.info("******* Fin de la synchronisation Flatchr %s" % datetime.now())
-        _logger.info("******* %s Annonces et %s Candidats synchronisés en %s" % (i, j, datetime.now() - date_start))
+        if report is None:
+            if watermark_cap and new_watermark > watermark_cap:
+                _logger.info("******* Watermark Flatchr retenu au %s pour réessayer les candidats en échec" % watermark_cap[0])
+                new_watermark = watermark_cap
+            sync_state.set_watermark(new_watermark, full_sync=full_sync)
+        return i, j
 
     #def set_recruit(self):
     #    for record in self:
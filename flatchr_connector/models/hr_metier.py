@@ -10,7 +10,7 @@ class HrMetier(models.Model):
     _description = 'HR metier'
 
     name = fields.Char("Metier")
-    flatchr_id = fields.Integer("Flatchr ID")
+    flatchr_id = fields.Integer("Flatchr ID", copy=False)
 
     _sql_constraints = [
         ('flatchr_id_uniq', 'unique (flatchr_id)', "Metier already exists !"),
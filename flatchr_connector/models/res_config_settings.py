@@ -1,3 +1,4 @@
+from datetime import datetime, timedelta
 from odoo import _, fields, models
 from odoo.exceptions import UserError, ValidationError
 import logging
@@ -15,6 +16,13 @@ class ResConfigSettings(models.TransientModel):
     flatchr_is_cron_active = fields.Boolean(string="Active", default=lambda self: self.env.ref('flatchr_connector.cron_get_jobs_from_flatchr').active)
     last_sync_date = fields.Date("Last sync date", default=lambda self: self._context.get("date", fields.Date.context_today(self)), required=True)
     sync_period = fields.Integer("Sync period", default=365, required=True)
+    sync_workers = fields.Integer("Sync workers", default=8, required=True,
+                                  help="Number of concurrent requests used to fetch the applicants details from Flatchr")
+    rate_limit = fields.Float("Rate limit", default=10, required=True,
+                              help="Maximum number of requests per second sent to the Flatchr API")
+    flatchr_webhook_secret = fields.Char(string="Webhook secret",
+                                         help="Secret shared with Flatchr to sign the webhook events, "
+                                              "the periodic synchronisation then only runs at night as a reconciliation")
 
     def set_values(self):
         res = super(ResConfigSettings, self).set_values()
@@ -24,10 +32,26 @@ class ResConfigSettings(models.TransientModel):
         self.env['ir.config_parameter'].set_param('flatchr_connector.flatchr_token', self.flatchr_token)
         self.env['ir.config_parameter'].set_param('flatchr_connector.last_sync_date', self.last_sync_date)
         self.env['ir.config_parameter'].set_param('flatchr_connector.sync_period', self.sync_period)
+        self.env['ir.config_parameter'].set_param('flatchr_connector.sync_workers', max(1, self.sync_workers))
+        self.env['ir.config_parameter'].set_param('flatchr_connector.rate_limit', self.rate_limit if self.rate_limit > 0 else 10)
+        self.env['ir.config_parameter'].set_param('flatchr_connector.webhook_secret', self.flatchr_webhook_secret)
 
-        self.env.ref('flatchr_connector.cron_get_jobs_from_flatchr').write({'active': self.flatchr_is_cron_active})
+        cron_id = self.env.ref('flatchr_connector.cron_get_jobs_from_flatchr')
+        cron_id.write({'active': self.flatchr_is_cron_active})
+        self.set_sync_schedule(cron_id, bool(self.flatchr_webhook_secret))
         return res
 
+    @staticmethod
+    def set_sync_schedule(cron_id, webhook):
+        """Poll Flatchr every 12 hours, or once a night when the webhook events keep the data up to date."""
+        interval = (1, 'days') if webhook else (12, 'hours')
+        if (cron_id.interval_number, cron_id.interval_type) == interval:
+            return
+        vals = {'interval_number': interval[0], 'interval_type': interval[1]}
+        if webhook:
+            vals['nextcall'] = (datetime.now() + timedelta(days=1)).replace(hour=2, minute=0, second=0, microsecond=0)
+        cron_id.write(vals)
+
     def get_values(self):
         res = super(ResConfigSettings, self).get_values()
         api_key = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.flatchr_api_key', "")
@@ -36,6 +60,9 @@ class ResConfigSettings(models.TransientModel):
         flatchr_token = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.flatchr_token', "")
         last_sync_date = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.last_sync_date', "")
         sync_period = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.sync_period', "")
+        sync_workers = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.sync_workers', 8)
+        rate_limit = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.rate_limit', 10)
+        webhook_secret = self.env['ir.config_parameter'].sudo().get_param('flatchr_connector.webhook_secret', "")
 
         cron_id = self.env.ref('flatchr_connector.cron_get_jobs_from_flatchr')
         res.update(flatchr_api_key=api_key,
@@ -44,17 +71,21 @@ class ResConfigSettings(models.TransientModel):
                    flatchr_token=flatchr_token,
                    flatchr_is_cron_active=cron_id.active,
                    last_sync_date=last_sync_date,
-                   sync_period=sync_period
+                   sync_period=sync_period,
+                   sync_workers=int(sync_workers),
+                   rate_limit=float(rate_limit),
+                   flatchr_webhook_secret=webhook_secret
                    )
         return res
 
     def test_flatchr_api_call(self):
+        """Check that the Flatchr servers accept the saved credentials, without synchronising anything."""
         self.ensure_one()
-        msg = _('Odoo was succesfully able to retrieve jobs and applicants from the Flatchr servers.')
+        msg = _('Odoo was succesfully able to reach the Flatchr servers with your credentials.')
         msg_type = 'success'
 
         try:
-            self.env['hr.job'].fetch_flatchr_data()
+            self.env['hr.job'].check_flatchr_connection()
 
         except Exception as e:
             msg = _(
@@ -72,3 +103,11 @@ class ResConfigSettings(models.TransientModel):
                 'type': msg_type,
             }
         }
+
+    def action_flatchr_full_sync(self):
+        self.ensure_one()
+        return self.env['flatchr.sync.job'].enqueue('full_sync').action_open()
+
+    def action_flatchr_dry_run(self):
+        self.ensure_one()
+        return self.env['flatchr.sync.job'].enqueue('dry_run').action_open()
@@ -4,4 +4,8 @@ from odoo import fields, models
 class ResPartner(models.Model):
     _inherit = "res.partner"
 
-    flatchr_applicant_id = fields.Char(string="Flatchr Applicant ID")
+    flatchr_applicant_id = fields.Char(string="Flatchr Applicant ID", copy=False)
+
+    _sql_constraints = [
+        ('flatchr_applicant_id_uniq', 'unique (flatchr_applicant_id)', "Flatchr applicant already exists !"),
+    ]
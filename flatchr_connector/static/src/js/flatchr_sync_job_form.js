@@ -0,0 +1,42 @@
+odoo.define('flatchr_connector.sync_job_form', function (require) {
+    "use strict";
+
+    var FormController = require('web.FormController');
+    var FormView = require('web.FormView');
+    var viewRegistry = require('web.view_registry');
+
+    // Delay between two reloads of a pending or running job, in milliseconds
+    var REFRESH_DELAY = 5000;
+
+    var SyncJobFormController = FormController.extend({
+
+        start: function () {
+            var self = this;
+            this.refreshTimer = setInterval(function () {
+                self._refreshProgress();
+            }, REFRESH_DELAY);
+            return this._super.apply(this, arguments);
+        },
+        destroy: function () {
+            clearInterval(this.refreshTimer);
+            this._super.apply(this, arguments);
+        },
+        _refreshProgress: function () {
+            var record = this.model.get(this.handle);
+            if (record && ['pending', 'running'].includes(record.data.state)) {
+                this.reload();
+            }
+        },
+
+    });
+
+    var SyncJobFormView = FormView.extend({
+        config: _.extend({}, FormView.prototype.config, {
+            Controller: SyncJobFormController,
+        }),
+    });
+
+    viewRegistry.add('flatchr_sync_job_form', SyncJobFormView);
+
+    return SyncJobFormController;
+});
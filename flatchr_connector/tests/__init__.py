@@ -0,0 +1,7 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+from . import test_flatchr_sync
+from . import test_flatchr_benchmark
+from . import test_flatchr_webhook
+from . import test_flatchr_account
+from . import test_flatchr_cv_import
+from . import test_migration_util
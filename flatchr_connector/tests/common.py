@@ -0,0 +1,246 @@
+# Copyright 2022 ELITE Advanced technologies.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import collections
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+
+class FlatchrMockServer(object):
+    """Local stand-in for careers.flatchr.io and api.flatchr.io serving synthetic data.
+
+    `vacancies` and `applicants` are the sizes of the generated feeds, `latency` the delay
+    in seconds added to every request. The applicants are spread over the last `days` days.
+    CVs are served under /cv/<name>, a 404 for the names starting with "missing", and a 503
+    for the next `cv_errors[name]` requests of a name. The feed and search requests answer the
+    (status, Retry-After) pairs queued in `failures['feed']` and `failures['search']` first.
+    """
+
+    slug = 'mock-company'
+    company_key = 'mock-key'
+
+    def __init__(self, vacancies=10, applicants=100, latency=0.0, days=30, prefix='mock'):
+        self.latency = latency
+        self.requests = collections.Counter()
+        self.cv_errors = collections.Counter()
+        self.failures = collections.defaultdict(list)
+        now = datetime.now()
+
+        self.vacancies = [self._make_vacancy(prefix, index, now) for index in range(vacancies)]
+        self.publish_vacancies(self.vacancies)
+
+        # Applicants are serialized once so that serving them does not weigh on the measured memory
+        self.prefix = prefix
+        self.applicants = []
+        self.vacancy_by_applicant = {}
+        for index in range(applicants):
+            self.add_applicant('%s-a%09d' % (prefix, index), now - timedelta(days=days * index / max(applicants, 1)), index)
+
+        self.server = None
+        self.thread = None
+
+    def publish_vacancies(self, vacancies):
+        """Serve `vacancies` in the careers feed."""
+        self.feed = json.dumps({'items': [{'vacancy': vacancy} for vacancy in vacancies]}).encode()
+        self.etag = '"%s"' % hashlib.md5(self.feed).hexdigest()
+
+    def add_applicant(self, flatchr_applicant_id, created_at, index):
+        """Publish an applicant created at `created_at`, applying to the vacancy `index` modulo the vacancy count."""
+        applicant = {
+            'applicant': flatchr_applicant_id,
+            'firstname': 'Firstname%s' % index,
+            'lastname': 'Lastname%s' % index,
+            'email': 'applicant%s@%s.example.com' % (index, self.prefix),
+            'phone': '+33600%06d' % index,
+            'vacancy': 'vacancy',
+            'source': 'Mock',
+            'created_at': created_at.strftime('%d/%m/%y'),
+        }
+        if self.vacancies:
+            self.vacancy_by_applicant[flatchr_applicant_id] = self.vacancies[index % len(self.vacancies)]['id']
+        self.applicants.append((created_at.date(), json.dumps(applicant).encode()))
+
+    @staticmethod
+    def _make_vacancy(prefix, index, now):
+        return {
+            'id': '%s-v%06d' % (prefix, index),
+            'title': 'Vacancy %s' % index,
+            'reference': 'REF%s' % index,
+            'description': '<p>Description %s</p>' % index,
+            'mission': '<p>Mission</p>',
+            'profile': '<p>Profile</p>',
+            'experience': index % 10,
+            'salary': 30000 + index,
+            'contract_type': 'CDI',
+            'contract_type_id': 1 + index % 3,
+            'education_level': 'Bac +%s' % (index % 5),
+            'education_level_id': 1 + index % 5,
+            'activity': 'Activity %s' % (index % 7),
+            'activity_id': 1 + index % 7,
+            'channel': 'Channel %s' % (index % 4),
+            'channel_id': 1 + index % 4,
+            'metier': 'Metier %s' % (index % 11),
+            'metier_id': 1 + index % 11,
+            'mensuality': 'm',
+            'driver_license': bool(index % 2),
+            'remote': False,
+            'handicap': False,
+            'partial': False,
+            'created_at': (now - timedelta(days=index % 90)).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server.server_address[1]
+
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.do_GET(head=True)
+
+            def do_GET(self, head=False):
+                time.sleep(mock.latency)
+                path = self.path.split('?')[0]
+                if path == '/company/%s.json' % mock.slug:
+                    mock.requests['feed'] += 1
+                    if self._fail('feed'):
+                        return
+                    if self.headers.get('If-None-Match') == mock.etag:
+                        mock.requests['feed_not_modified'] += 1
+                        return self._send(304, b'')
+                    return self._send(200, mock.feed, {'ETag': mock.etag}, head=head)
+
+                if path.startswith('/cv/'):
+                    mock.requests['cv'] += 1
+                    name = path[len('/cv/'):]
+                    if mock.cv_errors[name] > 0:
+                        mock.cv_errors[name] -= 1
+                        return self._send(503, b'{}')
+                    if name.startswith('missing'):
+                        return self._send(404, b'{}')
+                    return self._send(200, b'%PDF-1.4 ' + name.encode(), head=head)
+
+                prefix = '/company/%s/applicant/' % mock.company_key
+                if path.startswith(prefix) and path[len(prefix):] in mock.vacancy_by_applicant:
+                    mock.requests['applicant'] += 1
+                    body = json.dumps({'vacancy_id': mock.vacancy_by_applicant[path[len(prefix):]]}).encode()
+                    return self._send(200, body, head=head)
+                return self._send(404, b'{}')
+
+            def do_POST(self):
+                time.sleep(mock.latency)
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path.split('?')[0] != '/company/%s/search/applicants' % mock.company_key:
+                    return self._send(404, b'{}')
+
+                mock.requests['search'] += 1
+                if self._fail('search'):
+                    return
+                criteria = json.loads(body or b'{}')
+                start = datetime.fromisoformat(criteria['start']).date() if criteria.get('start') else None
+                end = datetime.fromisoformat(criteria['end']).date() if criteria.get('end') else None
+                items = [item for created_at, item in mock.applicants
+                         if (not start or created_at >= start) and (not end or created_at < end)]
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(2 + sum(len(item) for item in items) + max(len(items) - 1, 0)))
+                self.end_headers()
+                self.wfile.write(b'[')
+                for index, item in enumerate(items):
+                    self.wfile.write(b',' + item if index else item)
+                self.wfile.write(b']')
+
+            def _fail(self, endpoint):
+                if not mock.failures[endpoint]:
+                    return False
+                status, retry_after = mock.failures[endpoint].pop(0)
+                mock.requests['failed'] += 1
+                self._send(status, b'{}', {'Retry-After': retry_after} if retry_after else None)
+                return True
+
+            def _send(self, status, body, headers=None, head=False):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FlatchrMockCase(TransactionCase):
+    """Run the connector against a FlatchrMockServer.
+
+    The commits and rollbacks of the sync are replaced by a savepoint of the test transaction, so that
+    a rollback only drops the work done since the last commit, as it does outside of the tests.
+    """
+
+    mock_vacancies = 5
+    mock_applicants = 40
+    mock_latency = 0.0
+
+    @classmethod
+    def setUpClass(cls):
+        super(FlatchrMockCase, cls).setUpClass()
+        cls.flatchr_server = FlatchrMockServer(cls.mock_vacancies, cls.mock_applicants, cls.mock_latency).start()
+        cls.addClassCleanup(cls.flatchr_server.stop)
+
+    def setUp(self):
+        super(FlatchrMockCase, self).setUp()
+        self.use_flatchr_server(self.flatchr_server)
+        cr = self.env.cr
+        cr.execute('SAVEPOINT flatchr_sync')
+
+        def commit():
+            self.env['base'].flush()
+            cr.execute('RELEASE SAVEPOINT flatchr_sync')
+            cr.execute('SAVEPOINT flatchr_sync')
+
+        def rollback():
+            self.env.clear()
+            cr.execute('ROLLBACK TO SAVEPOINT flatchr_sync')
+
+        for name, method in (('commit', commit), ('rollback', rollback)):
+            patcher = patch.object(cr, name, method)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def use_flatchr_server(self, server):
+        set_param = self.env['ir.config_parameter'].sudo().set_param
+        set_param('flatchr_connector.careers_url', server.url)
+        set_param('flatchr_connector.api_url', server.url)
+        set_param('flatchr_connector.flatchr_enterprise_slug', server.slug)
+        set_param('flatchr_connector.flatchr_company_key', server.company_key)
+        set_param('flatchr_connector.flatchr_token', 'mock-token')
+        set_param('flatchr_connector.sync_period', 30)
+        set_param('flatchr_connector.sync_workers', 4)
+        set_param('flatchr_connector.rate_limit', 10000)
+        sync_state = self.env['flatchr.sync.state'].sudo().get_state()
+        sync_state.reset_watermark()
+        sync_state.write({'feed_etag': False, 'feed_last_modified': False, 'feed_hash': False})
@@ -0,0 +1,92 @@
+# Copyright 2022 ELITE Advanced technologies.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from odoo.addons.flatchr_connector.models.hr_job import ACCOUNT_LOCK_KEY
+
+from .common import FlatchrMockCase, FlatchrMockServer
+
+
+@tagged("-at_install", "post_install")
+class TestFlatchrAccount(FlatchrMockCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestFlatchrAccount, cls).setUpClass()
+        cls.tenant_server = FlatchrMockServer(3, 12, prefix="tenant").start()
+        cls.addClassCleanup(cls.tenant_server.stop)
+
+    def setUp(self):
+        super(TestFlatchrAccount, self).setUp()
+        self.company = self.env["res.company"].create({"name": "Flatchr tenant"})
+        self.account = self.env["flatchr.account"].create({
+            "name": "Tenant",
+            "company_id": self.company.id,
+            "flatchr_enterprise_slug": self.tenant_server.slug,
+            "flatchr_company_key": self.tenant_server.company_key,
+            "flatchr_token": "tenant-token",
+            "careers_url": self.tenant_server.url,
+            "api_url": self.tenant_server.url,
+            "sync_period": 30,
+            "sync_workers": 2,
+            "rate_limit": 10000,
+        })
+
+    def test_account_sync(self):
+        run = self.env["hr.job"].fetch_flatchr_data(account=self.account)
+
+        self.assertEqual(run.account_id, self.account)
+        jobs = self.env["hr.job"].search([("flatchr_job_id", "=like", "tenant-%")])
+        self.assertEqual(len(jobs), 3)
+        self.assertEqual(jobs.company_id, self.company)
+        applicants = self.env["hr.applicant"].search([("flatchr_applicant_id", "=like", "tenant-%")])
+        self.assertEqual(len(applicants), 12)
+
+        # Each account keeps its own watermark
+        self.assertTrue(self.env["flatchr.sync.state"].get_state(self.account).watermark_date)
+        self.assertFalse(self.env["flatchr.sync.state"].get_state().watermark_date)
+        self.assertTrue(self.account.last_sync_date)
+
+    def test_overlapping_syncs(self):
+        HrJob = type(self.env["hr.job"])
+        fetch = HrJob._fetch_flatchr_data
+        lock = "SELECT pg_try_advisory_lock(%s, %s)"
+        with self.registry.cursor() as cr:
+            def locked_fetch(job, *args):
+                # The running synchronisation holds the account from another session
+                cr.execute(lock, [ACCOUNT_LOCK_KEY, self.account.id])
+                self.assertFalse(cr.fetchone()[0])
+                return fetch(job, *args)
+
+            with patch.object(HrJob, "_fetch_flatchr_data", locked_fetch):
+                self.env["hr.job"].fetch_flatchr_data(account=self.account)
+
+            # Released at the end, then held by the other session
+            cr.execute(lock, [ACCOUNT_LOCK_KEY, self.account.id])
+            self.assertTrue(cr.fetchone()[0])
+            try:
+                with self.assertRaises(UserError):
+                    self.env["hr.job"].fetch_flatchr_data(account=self.account)
+                # The global settings and a dry run are not held by the lock of the account
+                self.env["hr.job"].fetch_flatchr_data()
+                run = self.env["hr.job"].fetch_flatchr_data(account=self.account, dry_run=True)
+                self.assertEqual(run.state, "done")
+            finally:
+                cr.execute("SELECT pg_advisory_unlock(%s, %s)", [ACCOUNT_LOCK_KEY, self.account.id])
+
+    def test_failing_account_is_rescheduled(self):
+        # The dispatcher runs on the cursor of the test
+        patch.object(self.registry, "cursor", lambda: nullcontext(self.env.cr)).start()
+        self.addCleanup(patch.stopall)
+        self.tenant_server.failures["feed"] = [(404, None)]
+        self.account.nextcall = datetime.now() - timedelta(minutes=1)
+
+        self.env["flatchr.account"]._run_account(self.account.id)
+
+        # A feed error is not mistaken for a running synchronisation, the next call is scheduled
+        self.assertGreater(self.account.nextcall, datetime.now() + timedelta(hours=11))
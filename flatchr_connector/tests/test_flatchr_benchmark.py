@@ -0,0 +1,56 @@
+# Copyright 2022 ELITE Advanced technologies.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+import os
+import time
+import tracemalloc
+
+from odoo.tests import tagged
+
+from .common import FlatchrMockCase, FlatchrMockServer
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged("-standard", "-at_install", "post_install", "flatchr_benchmark")
+class TestFlatchrBenchmark(FlatchrMockCase):
+    """Measure fetch_flatchr_data against the mock server, run with --test-tags flatchr_benchmark.
+
+    Environment variables:
+    - FLATCHR_BENCHMARK_SIZES: comma separated applicant counts (default 1000,10000,100000)
+    - FLATCHR_BENCHMARK_LATENCY: latency of the mock server in seconds (default 0.01)
+    - FLATCHR_BENCHMARK_MAX_QUERIES: if set, maximum number of SQL queries per applicant
+    """
+
+    def test_benchmark_sync(self):
+        sizes = [int(size) for size in os.getenv("FLATCHR_BENCHMARK_SIZES", "1000,10000,100000").split(",")]
+        latency = float(os.getenv("FLATCHR_BENCHMARK_LATENCY", "0.01"))
+        max_queries = os.getenv("FLATCHR_BENCHMARK_MAX_QUERIES")
+
+        results = []
+        for size in sizes:
+            server = FlatchrMockServer(vacancies=max(1, size // 50), applicants=size, latency=latency, prefix="bench%s" % size)
+            server.start()
+            try:
+                self.use_flatchr_server(server)
+                queries = self.env.cr.sql_log_count
+                tracemalloc.start()
+                start = time.monotonic()
+                self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+                duration = time.monotonic() - start
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                queries = self.env.cr.sql_log_count - queries
+            finally:
+                server.stop()
+
+            results.append((size, duration, queries, peak_memory))
+            if max_queries:
+                with self.subTest(size=size):
+                    self.assertLessEqual(queries / size, float(max_queries))
+
+        _logger.info("Flatchr sync benchmark (latency %.0f ms):", latency * 1000)
+        _logger.info("%12s %12s %14s %12s %14s", "applicants", "duration", "applicants/s", "queries", "peak memory")
+        for size, duration, queries, peak_memory in results:
+            _logger.info("%12d %11.1fs %14.1f %12d %12.1fMB", size, duration, size / duration, queries, peak_memory / 1024 / 1024)
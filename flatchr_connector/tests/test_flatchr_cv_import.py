@@ -0,0 +1,103 @@
+# Copyright 2022 ELITE Advanced technologies.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import base64
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from odoo.addons.flatchr_connector.models.hr_applicant import CV_DOWNLOAD_RETRIES
+
+from .common import FlatchrMockCase
+
+
+@tagged("-at_install", "post_install")
+class TestFlatchrCvImport(FlatchrMockCase):
+    def setUp(self):
+        super(TestFlatchrCvImport, self).setUp()
+        patcher = patch("odoo.addons.flatchr_connector.models.hr_applicant.CV_DOWNLOAD_BACKOFF", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.job = self.env["hr.job"].create({"name": "CV import job"})
+        self.applicant = self._create_applicant("cv@example.com")
+
+    def _create_applicant(self, email, job=None):
+        return self.env["hr.applicant"].create({
+            "name": email,
+            "partner_name": email,
+            "email_from": email,
+            "job_id": (job or self.job).id,
+        })
+
+    def _import(self, *rows):
+        """Import a CSV whose rows are (email, CV name, job name) triples."""
+        lines = [";".join(["x", email, "%s/cv/%s" % (self.flatchr_server.url, cv), job]) for email, cv, job in rows]
+        self.env["hr.applicant"].import_cvs(self.env, base64.b64encode("\n".join(lines).encode()))
+
+    def _cvs(self, applicant):
+        return self.env["ir.attachment"].search([("res_model", "=", "hr.applicant"), ("res_id", "=", applicant.id)])
+
+    def _line(self, cv):
+        return self.env["flatchr.cv.import.line"].search([("download_url", "=like", "%/cv/" + cv)])
+
+    def test_failed_row_falls_back_to_next_row(self):
+        self._import(("cv@example.com", "missing-fallback", "CV import job"), ("cv@example.com", "fallback", "CV import job"))
+
+        self.assertEqual(len(self._cvs(self.applicant)), 1)
+        self.assertEqual(self._line("missing-fallback").state, "failed")
+        # a client error is not retried
+        self.assertEqual(self._line("missing-fallback").attempts, 1)
+        self.assertEqual(self._line("fallback").state, "done")
+
+    def test_retry_and_resume(self):
+        self.flatchr_server.cv_errors["flaky"] = CV_DOWNLOAD_RETRIES
+        self._import(("cv@example.com", "flaky", "CV import job"))
+
+        self.assertFalse(self._cvs(self.applicant))
+        self.assertEqual(self._line("flaky").state, "failed")
+        self.assertEqual(self._line("flaky").attempts, CV_DOWNLOAD_RETRIES)
+
+        # the failed row is tried again by the next import
+        self._import(("cv@example.com", "flaky", "CV import job"))
+        self.assertEqual(len(self._cvs(self.applicant)), 1)
+        self.assertEqual(self._line("flaky").state, "done")
+        self.assertEqual(self._line("flaky").attempts, CV_DOWNLOAD_RETRIES + 1)
+
+        # the imported row is skipped
+        self.flatchr_server.requests.clear()
+        self._import(("cv@example.com", "flaky", "CV import job"))
+        self.assertEqual(self.flatchr_server.requests["cv"], 0)
+        self.assertEqual(len(self._cvs(self.applicant)), 1)
+
+    def test_rows_matched_on_email_and_job(self):
+        other_job = self.env["hr.job"].create({"name": "Other CV import job"})
+        other_applicant = self._create_applicant("cv@example.com", other_job)
+        unknown_job_applicant = self._create_applicant("unknown@example.com")
+
+        self._import(("cv@example.com", "matched", "Other CV import job"), ("unknown@example.com", "unknown", "Unknown job"))
+
+        self.assertFalse(self._cvs(self.applicant))
+        self.assertEqual(len(self._cvs(other_applicant)), 1)
+        self.assertFalse(self._cvs(unknown_job_applicant))
+        self.assertFalse(self._line("unknown"))
+
+    def test_applicants_with_cv(self):
+        other_applicant = self._create_applicant("other@example.com")
+        self.env["ir.attachment"].create({
+            "name": "cv_other@example.com",
+            "res_model": "hr.applicant",
+            "res_id": other_applicant.id,
+            "datas": base64.b64encode(b"%PDF-1.4"),
+        })
+        applicants = self.applicant | other_applicant
+
+        self.assertEqual(applicants.get_applicants_with_cv(), {other_applicant.id})
+        self.assertTrue(other_applicant.has_cv())
+        self.assertFalse(self.applicant.has_cv())
+
+        # the applicants having a CV are not downloaded again
+        self.flatchr_server.requests.clear()
+        self._import(("cv@example.com", "first", "CV import job"), ("other@example.com", "second", "CV import job"))
+        self.assertEqual(self.flatchr_server.requests["cv"], 1)
+        self.assertEqual(len(self._cvs(self.applicant)), 1)
+        self.assertEqual(len(self._cvs(other_applicant)), 1)
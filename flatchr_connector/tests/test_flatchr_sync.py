@@ -0,0 +1,284 @@
+# Copyright 2022 ELITE Advanced technologies.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import base64
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from requests.exceptions import HTTPError
+
+from odoo.tests import tagged
+
+from odoo.addons.flatchr_connector.lib.flatchr_client import FlatchrClient, iter_json_array
+
+from .common import FlatchrMockCase, FlatchrMockServer
+
+
+@tagged("-at_install", "post_install")
+class TestFlatchrSync(FlatchrMockCase):
+    def _flatchr_records(self, model, field):
+        return self.env[model].with_context(active_test=False).search([(field, "=like", "mock-%")])
+
+    def test_full_sync(self):
+        self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+
+        jobs = self._flatchr_records("hr.job", "flatchr_job_id")
+        applicants = self._flatchr_records("hr.applicant", "flatchr_applicant_id")
+        self.assertEqual(len(jobs), self.mock_vacancies)
+        self.assertEqual(len(applicants), self.mock_applicants)
+        self.assertEqual(len(self._flatchr_records("res.partner", "flatchr_applicant_id")), self.mock_applicants)
+        self.assertTrue(all(jobs.mapped("contract_type_id")))
+        self.assertEqual(self.flatchr_server.requests["applicant"], self.mock_applicants)
+
+    def test_incremental_sync(self):
+        self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        self.flatchr_server.requests.clear()
+
+        self.env["hr.job"].fetch_flatchr_data()
+
+        # Nothing changed: the feed is not modified and no applicant detail is fetched again
+        self.assertEqual(self.flatchr_server.requests["feed_not_modified"], 1)
+        self.assertEqual(self.flatchr_server.requests["applicant"], 0)
+        self.assertEqual(len(self._flatchr_records("hr.applicant", "flatchr_applicant_id")), self.mock_applicants)
+
+    def test_incremental_sync_watermark_day(self):
+        server = FlatchrMockServer(2, 6, prefix="sameday").start()
+        self.addCleanup(server.stop)
+        self.use_flatchr_server(server)
+        self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+
+        # The Flatchr IDs are not ordered: a new applicant of the watermark day can sort before the imported ones
+        server.add_applicant("sameday-0", datetime.now(), 0)
+        server.requests.clear()
+        run = self.env["hr.job"].fetch_flatchr_data()
+
+        self.assertTrue(self.env["hr.applicant"].search([("flatchr_applicant_id", "=", "sameday-0")]))
+        self.assertEqual(run.applicants_created, 1)
+        # The applicants of the watermark day already imported are not fetched again
+        self.assertEqual(server.requests["applicant"], 1)
+
+    def test_failed_applicant_is_retried(self):
+        server = FlatchrMockServer(2, 6, prefix="retry").start()
+        self.addCleanup(server.stop)
+        self.use_flatchr_server(server)
+        # The oldest applicant: the watermark must not pass it
+        failed_id = json.loads(server.applicants[-1][1])["applicant"]
+        vacancy_id = server.vacancy_by_applicant.pop(failed_id)
+
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        self.assertEqual(run.applicants_failed, 1)
+        self.assertFalse(self.env["hr.applicant"].search([("flatchr_applicant_id", "=", failed_id)]))
+
+        server.vacancy_by_applicant[failed_id] = vacancy_id
+        server.requests.clear()
+        run = self.env["hr.job"].fetch_flatchr_data()
+
+        self.assertTrue(self.env["hr.applicant"].search([("flatchr_applicant_id", "=", failed_id)]))
+        self.assertEqual(run.applicants_created, 1)
+        # The applicants imported after it are not fetched again
+        self.assertEqual(server.requests["applicant"], 1)
+
+    def test_unknown_vacancy_does_not_hold_watermark(self):
+        server = FlatchrMockServer(2, 6, prefix="unknown").start()
+        self.addCleanup(server.stop)
+        self.use_flatchr_server(server)
+        # The oldest applicant applied to a vacancy missing from the feed, it is not retried
+        server.vacancy_by_applicant[json.loads(server.applicants[-1][1])["applicant"]] = "unknown-vacancy"
+
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+
+        self.assertEqual(run.applicants_skipped, 1)
+        watermark = self.env["flatchr.sync.state"].get_state().watermark_date
+        self.assertEqual(watermark.date(), server.applicants[0][0])
+
+    def test_full_resync_is_idempotent(self):
+        self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+
+        self.assertEqual(len(self._flatchr_records("hr.job", "flatchr_job_id")), self.mock_vacancies)
+        self.assertEqual(len(self._flatchr_records("hr.applicant", "flatchr_applicant_id")), self.mock_applicants)
+
+    def test_archived_partner_is_kept(self):
+        self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        partner = self._flatchr_records("res.partner", "flatchr_applicant_id")[:1]
+        partner.active = False
+
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True, dry_run=True)
+        rows = base64.b64decode(run.diff_report).decode().splitlines()[1:]
+        self.assertFalse([row for row in rows if row.startswith("res.partner;") and row.endswith(";create;")])
+
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        self.assertEqual(run.state, "done")
+        self.assertEqual(len(self._flatchr_records("res.partner", "flatchr_applicant_id")), self.mock_applicants)
+        self.assertFalse(partner.active)
+
+    def test_sync_run_journal(self):
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+
+        self.assertEqual(run.state, "done")
+        self.assertEqual(run.vacancies_created, self.mock_vacancies)
+        self.assertEqual(run.applicants_created, self.mock_applicants)
+        self.assertGreater(run.query_count, 0)
+        self.assertGreater(run.time_feed, 0)
+
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        self.assertEqual(run.vacancies_skipped, self.mock_vacancies)
+        self.assertEqual(run.applicants_created, 0)
+        self.assertEqual(run.applicants_skipped, self.mock_applicants)
+        self.assertEqual(run.applicants_updated, 0)
+
+    def test_dry_run(self):
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True, dry_run=True)
+
+        self.assertFalse(self._flatchr_records("hr.job", "flatchr_job_id"))
+        self.assertFalse(self._flatchr_records("hr.applicant", "flatchr_applicant_id"))
+        self.assertFalse(self.env["flatchr.sync.state"].get_state().watermark_date)
+        self.assertEqual(run.vacancies_created, self.mock_vacancies)
+        self.assertEqual(run.applicants_created, self.mock_applicants)
+        rows = base64.b64decode(run.diff_report).decode().splitlines()[1:]
+        self.assertEqual(sum(1 for row in rows if row.startswith("hr.applicant;") and row.endswith(";create;")), self.mock_applicants)
+
+        self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True, dry_run=True)
+        self.assertEqual(run.vacancies_skipped, self.mock_vacancies)
+        self.assertEqual(run.applicants_created, 0)
+        self.assertEqual(run.applicants_skipped, self.mock_applicants)
+        self.assertEqual(run.applicants_updated, 0)
+
+    def test_missing_vacancies_are_closed(self):
+        closed_job = self.env["hr.job"].create({"name": "Closed on Flatchr", "flatchr_job_id": "mock-closed"})
+        other_job = self.env["hr.job"].create({"name": "Not from Flatchr"})
+
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+
+        self.assertEqual(closed_job.state, "open")
+        self.assertEqual(other_job.state, "recruit")
+        self.assertEqual(set(self._flatchr_records("hr.job", "flatchr_job_id").filtered(
+            lambda job: job != closed_job).mapped("state")), {"recruit"})
+        self.assertEqual(run.vacancies_closed, 1)
+
+    def test_closed_vacancy_is_reopened(self):
+        server = self.flatchr_server
+        self.addCleanup(server.publish_vacancies, server.vacancies)
+        self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        job = self.env["hr.job"].search([("flatchr_job_id", "=", str(server.vacancies[0]["id"]))])
+        self.assertEqual(job.state, "recruit")
+
+        server.publish_vacancies(server.vacancies[1:])
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        self.assertEqual(run.vacancies_closed, 1)
+        self.assertEqual(job.state, "open")
+        self.assertTrue(job.flatchr_closed)
+
+        # The payload did not change, the job is reopened all the same
+        server.publish_vacancies(server.vacancies)
+        run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+        self.assertEqual(run.vacancies_closed, 0)
+        self.assertEqual(run.vacancies_skipped, len(server.vacancies))
+        self.assertEqual(job.state, "recruit")
+        self.assertFalse(job.flatchr_closed)
+
+    def test_failed_sync_is_rolled_back(self):
+        self.flatchr_server.failures["search"] = [(404, None)]
+
+        with self.assertRaises(HTTPError):
+            self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+
+        # The run and the vacancies committed before the failure are kept, the sync state is untouched
+        run = self.env["flatchr.sync.run"].search([], limit=1, order="id desc")
+        self.assertEqual(run.state, "failed")
+        self.assertEqual(len(self._flatchr_records("hr.job", "flatchr_job_id")), self.mock_vacancies)
+        self.assertFalse(self._flatchr_records("hr.applicant", "flatchr_applicant_id"))
+        self.assertFalse(self.env["flatchr.sync.state"].get_state().watermark_date)
+
+    def test_bad_applicant_is_quarantined(self):
+        HrApplicant = type(self.env["hr.applicant"])
+        create = HrApplicant.create
+        bad_id = json.loads(self.flatchr_server.applicants[3][1])["applicant"]
+
+        def failing_create(records, vals_list):
+            if any(vals.get("flatchr_applicant_id") == bad_id for vals in vals_list):
+                raise ValueError("Invalid applicant")
+            return create(records, vals_list)
+
+        with patch.object(HrApplicant, "create", failing_create):
+            run = self.env["hr.job"].fetch_flatchr_data(full_sync=True)
+
+        self.assertEqual(run.state, "done")
+        self.assertEqual(run.applicants_quarantined, 1)
+        self.assertEqual(len(self._flatchr_records("hr.applicant", "flatchr_applicant_id")), self.mock_applicants - 1)
+        quarantine = self.env["flatchr.applicant.quarantine"].search([("flatchr_applicant_id", "=", bad_id)])
+        self.assertEqual(quarantine.run_id, run)
+
+        quarantine.action_retry()
+        self.assertEqual(quarantine.state, "resolved")
+        self.assertEqual(len(self._flatchr_records("hr.applicant", "flatchr_applicant_id")), self.mock_applicants)
+
+    def test_resume_from_checkpoint(self):
+        sync_state = self.env["flatchr.sync.state"].sudo().get_state()
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=30)
+        sync_state.set_checkpoint(start, 10, True, False)
+        # The committed applicants are not the first ones of the search: new applicants came in since
+        for created_at, item in self.flatchr_server.applicants[5:15]:
+            self.env["hr.applicant"].create({"name": "Committed", "flatchr_applicant_id": json.loads(item)["applicant"]})
+        self.flatchr_server.requests.clear()
+
+        run = self.env["hr.job"].fetch_flatchr_data()
+
+        # The applicants committed before the interruption are not fetched again
+        self.assertEqual(self.flatchr_server.requests["applicant"], self.mock_applicants - 10)
+        self.assertEqual(run.applicants_created, self.mock_applicants - 10)
+        self.assertEqual(len(self._flatchr_records("hr.applicant", "flatchr_applicant_id")), self.mock_applicants)
+        self.assertFalse(sync_state.get_checkpoint())
+        self.assertTrue(sync_state.last_full_sync_date)
+
+    def test_stale_running_job_is_failed(self):
+        job = self.env["flatchr.sync.job"].create({"name": "Killed", "state": "running", "date_start": datetime.now()})
+
+        self.env["flatchr.sync.job"].fail_stale_jobs()
+
+        self.assertEqual(job.state, "failed")
+        self.assertTrue(job.date_end)
+
+    def _flatchr_client(self, **kwargs):
+        url = self.flatchr_server.url
+        return FlatchrClient("mock-token", careers_url=url, api_url=url, rate_limit=10000, **kwargs)
+
+    def test_client_retries(self):
+        self.flatchr_server.failures["feed"] = [(429, "3"), (503, None)]
+        waits = []
+        with patch("odoo.addons.flatchr_connector.lib.flatchr_client.time.sleep", waits.append), \
+                self._flatchr_client() as client:
+            response = client.get_feed(self.flatchr_server.slug)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.metrics["feed"]["errors"], 2)
+        self.assertEqual(len(client.metrics["feed"]["latencies"]), 3)
+        # Retry-After is honoured, the 503 without it is retried after the backoff
+        self.assertIn(3, waits)
+
+    def test_client_retries_exhausted(self):
+        self.flatchr_server.failures["search"] = [(429, "0"), (429, "0")]
+        with self._flatchr_client(max_retries=1) as client:
+            response = client.search_applicants(self.flatchr_server.company_key, {})
+
+        # A Retry-After of 0 is retried at once, the last response is returned to the caller
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.flatchr_server.requests["failed"], 2)
+        self.assertFalse(self.flatchr_server.failures["search"])
+
+    def test_iter_json_array(self):
+        items = [{"id": index, "name": "é,]%s" % index} for index in range(50)]
+        data = json.dumps(items)
+        for size in (1, 7, len(data)):
+            chunks = (data[index:index + size] for index in range(0, len(data), size))
+            self.assertEqual(list(iter_json_array(chunks)), items)
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['[{"id": 1}']))
+
+    def test_iter_json_array_split_scalars(self):
+        data = '[4.5, true, null, -12e3, "a", {"b": [1]}, 7]'
+        items = json.loads(data)
+        for index in range(1, len(data)):
+            self.assertEqual(list(iter_json_array([data[:index], data[index:]])), items)
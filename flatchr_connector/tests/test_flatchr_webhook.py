@@ -0,0 +1,50 @@
+# Copyright 2022 ELITE Advanced technologies.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import hashlib
+import hmac
+import json
+
+from odoo.tests import tagged
+
+from .common import FlatchrMockCase
+
+
+@tagged("-at_install", "post_install")
+class TestFlatchrWebhook(FlatchrMockCase):
+    def setUp(self):
+        super(TestFlatchrWebhook, self).setUp()
+        self.env["ir.config_parameter"].sudo().set_param("flatchr_connector.webhook_secret", "mock-secret")
+        self.events = self.env["flatchr.webhook.event"].sudo()
+
+    def _sign(self, body):
+        return "sha256=" + hmac.new(b"mock-secret", body, hashlib.sha256).hexdigest()
+
+    def test_check_signature(self):
+        body = b'{"id": 1}'
+        self.assertTrue(self.events.check_signature(body, self._sign(body)))
+        self.assertFalse(self.events.check_signature(body + b" ", self._sign(body)))
+        self.assertFalse(self.events.check_signature(body, None))
+
+    def test_process_events(self):
+        vacancy = self.flatchr_server.vacancies[0]
+        applicant = json.loads(self.flatchr_server.applicants[0][1])
+        body = json.dumps([
+            {"id": "evt-1", "type": "vacancy.created", "data": vacancy},
+            {"id": "evt-2", "type": "applicant.created", "data": applicant},
+        ]).encode()
+
+        self.assertEqual(len(self.events.receive(body)), 2)
+        # Flatchr retries are ignored
+        self.assertFalse(self.events.receive(body))
+
+        self.events.process_pending_events()
+
+        events = self.events.search([("event_id", "in", ["evt-1", "evt-2"])])
+        self.assertEqual(set(events.mapped("state")), {"done"})
+        job = self.env["hr.job"].search([("flatchr_job_id", "=", vacancy["id"])])
+        self.assertTrue(job)
+        hr_applicant = self.env["hr.applicant"].search([("flatchr_applicant_id", "=", applicant["applicant"])])
+        self.assertEqual(hr_applicant.job_id, job)
+        # The vacancy of the applicant is fetched from the API as the event does not carry it
+        self.assertGreaterEqual(self.flatchr_server.requests["applicant"], 1)
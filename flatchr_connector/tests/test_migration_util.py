@@ -0,0 +1,135 @@
+# Copyright 2022 ELITE Advanced technologies.
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import re
+from collections import Counter
+from contextlib import nullcontext
+from unittest.mock import patch
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.flatchr_connector.migrations import util
+
+
+class ReltuplesCursor(object):
+    """Cursor answering `reltuples` to the statistics query of explode_query_range."""
+
+    def __init__(self, cr, reltuples):
+        self.cr = cr
+        self.reltuples = reltuples
+        self.row = None
+
+    def execute(self, query, params=None):
+        if "reltuples" in query:
+            self.row = (self.reltuples,)
+        else:
+            self.row = None
+            self.cr.execute(query, params)
+
+    def fetchone(self):
+        return self.row if self.row else self.cr.fetchone()
+
+    def mogrify(self, query, params=None):
+        return self.cr.mogrify(query, params)
+
+
+class FakeProcess(object):
+    """psutil.Process whose memory grows by `step` bytes at each sample."""
+
+    def __init__(self, step):
+        self.step = step
+        self.rss = 0
+
+    def memory_info(self):
+        self.rss += self.step
+        return type("MemoryInfo", (), {"rss": self.rss})
+
+
+@tagged("-at_install", "post_install")
+class TestMigrationUtil(TransactionCase):
+    def setUp(self):
+        super(TestMigrationUtil, self).setUp()
+        # The workers of the parallel helpers run one at a time on the cursor of the test
+        patch.object(util, "get_max_workers", lambda: 1).start()
+        patch.object(self.registry, "cursor", lambda: nullcontext(self.env.cr)).start()
+        self.commits = []
+        patch.object(self.env.cr, "commit", lambda: self.commits.append(True)).start()
+        self.addCleanup(patch.stopall)
+
+    def test_parallel_recompute_fields(self):
+        jobs = self.env["hr.job"].create([{"name": "Recompute %s" % index} for index in range(10)])
+        jobs.flush()
+        HrJob = type(self.env["hr.job"])
+        compute = HrJob._compute_employees
+        recompute_fields = util.recompute_fields
+        computed = Counter()
+        buckets = []
+
+        def counting_compute(records):
+            computed.update(records.ids)
+            return compute(records)
+
+        def bucket_recompute_fields(cr, model, fields, ids=None, **kwargs):
+            buckets.append(ids)
+            return recompute_fields(cr, model, fields, ids=ids, **kwargs)
+
+        with patch.object(HrJob, "_compute_employees", counting_compute), \
+                patch.object(util, "recompute_fields", bucket_recompute_fields):
+            util.parallel_recompute_fields(self.env.cr, "hr.job", ["no_of_employee"], ids=jobs.ids, chunk_size=3, num_buckets=3)
+
+        self.assertEqual([len(bucket) for bucket in buckets], [4, 4, 2])
+        self.assertEqual(computed, Counter(dict.fromkeys(jobs.ids, 1)))
+
+    def test_explode_query_range(self):
+        self.env.cr.execute("CREATE TEMP TABLE _explode_range (id int PRIMARY KEY)")
+        self.env.cr.execute("INSERT INTO _explode_range SELECT generate_series(7, 1000, 3)")
+
+        # -1 (PostgreSQL >= 14) and 0 before the first ANALYZE, then an estimate
+        for reltuples in (-1, 0, 331):
+            cr = ReltuplesCursor(self.env.cr, reltuples)
+            with patch.object(util, "EXPLODE_MIN_BUCKET_ROWS", 100):
+                queries = util.explode_query_range(cr, "SELECT id FROM _explode_range", "_explode_range")
+            ranges = [tuple(map(int, re.search(r"id BETWEEN (\d+) AND (\d+)", query).groups())) for query in queries]
+
+            self.assertEqual(len(ranges), 4)
+            self.assertEqual(ranges[0][0], 7)
+            self.assertEqual(ranges[-1][1], 997)
+            for (_start, end), (next_start, _end) in zip(ranges, ranges[1:]):
+                self.assertEqual(next_start, end + 1)
+
+        self.env.cr.execute("TRUNCATE _explode_range")
+        self.assertEqual(util.explode_query_range(self.env.cr, "SELECT id FROM _explode_range", "_explode_range"), [])
+
+    def test_iter_browse(self):
+        Partner = self.env["res.partner"]
+        partners = Partner.create([{"name": "Browse %s" % index} for index in range(5)])
+
+        # The call signature of the previous versions
+        self.assertEqual(list(util.iter_browse(Partner, partners.ids, chunk_size=2)), list(partners))
+        self.assertEqual(list(util.iter_browse(Partner, partners.ids, logger=None)), list(partners))
+        self.assertFalse(self.commits)
+        with self.assertRaises(TypeError):
+            util.iter_browse(Partner, partners.ids, chunk=2)
+
+    def test_iter_browse_chunks(self):
+        Partner = self.env["res.partner"]
+        partners = Partner.create([{"name": "Browse %s" % index} for index in range(5)])
+        chunks = []
+        records = list(util.iter_browse(Partner, partners.ids, chunk_size=2, fields=["name"], commit=True,
+                                        on_chunk=lambda records, duration: chunks.append(records)))
+
+        self.assertEqual(records, list(partners))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(len(self.commits), 3)
+
+    def test_iter_browse_memory_budget(self):
+        psutil = type("psutil", (), {"Process": staticmethod(lambda: FakeProcess(10 * 1024 * 1024))})
+        sizes = []
+        with patch.object(util, "psutil", psutil):
+            # Each chunk grows the memory by 10 MB, 10 times the budget of 1 MB
+            records = list(util.iter_browse(self.env["res.partner"], range(1, 201), chunk_size=100, memory_budget=1,
+                                            on_chunk=lambda records, duration: sizes.append(len(records))))
+
+        self.assertEqual(len(records), 200)
+        self.assertEqual(sizes, [100] + [util.ITER_BROWSE_MIN_CHUNK] * 10)
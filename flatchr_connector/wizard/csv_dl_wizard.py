@@ -16,5 +16,4 @@ class CsvDlWizard(models.TransientModel):
     csv_file = fields.Binary(string="Fichier CSV")
 
     def csv_dl_apply(self):
-        self.env['hr.job'].fetch_flatchr_data()
-        self.env['hr.applicant'].import_cvs(self.env, self.csv_file)
+        return self.env['flatchr.sync.job'].enqueue('cv_import', csv_file=self.csv_file).action_open()
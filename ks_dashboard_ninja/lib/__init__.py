@@ -1 +1,2 @@
 from . import ks_date_filter_selections
+from . import ks_item_data_cache
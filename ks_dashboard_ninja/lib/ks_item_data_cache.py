@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import defaultdict
+
+from odoo.tools.lru import LRU
+
+# Number of item payloads kept per database
+KS_ITEM_DATA_CACHE_SIZE = 512
+
+
+class KsItemDataCache(object):
+    """ LRU cache of the dashboard item payloads of a database, each entry expiring after its own timeout """
+
+    def __init__(self, size=KS_ITEM_DATA_CACHE_SIZE):
+        self.ks_entries = LRU(size)
+
+    def get(self, key):
+        entry = self.ks_entries.get(key)
+        if entry is None:
+            return None
+        ks_expire, payload = entry
+        # expired entries are overwritten by the next computation or evicted by the LRU
+        if ks_expire < time.monotonic():
+            return None
+        return payload
+
+    def set(self, key, payload, timeout):
+        self.ks_entries[key] = (time.monotonic() + timeout, payload)
+
+
+# Item payload caches by database name
+ks_item_data_caches = defaultdict(KsItemDataCache)
@@ -6,8 +6,19 @@ from odoo.exceptions import ValidationError
 import datetime
 import json
 from odoo.addons.ks_dashboard_ninja.lib.ks_date_filter_selections import ks_get_date
+from odoo.addons.ks_dashboard_ninja.lib.ks_item_data_cache import ks_item_data_caches
 from odoo.tools.safe_eval import safe_eval
 
+# Data sections of the item payload: item types displaying them and value sent to the others
+KS_ITEM_DATA_SECTIONS = {
+    'ks_record_count': (('ks_tile', 'ks_list_view'), 0),
+    'ks_chart_data': (('ks_bar_chart', 'ks_horizontalBar_chart', 'ks_line_chart', 'ks_area_chart', 'ks_pie_chart',
+                       'ks_doughnut_chart', 'ks_polarArea_chart'), False),
+    'ks_list_view_data': (('ks_list_view',), False),
+    'ks_kpi_data': (('ks_kpi',), False),
+    'ks_to_do_data': (('ks_to_do',), False),
+}
+
 
 class KsDashboardNinjaBoard(models.Model):
     _name = 'ks_dashboard_ninja.board'
@@ -263,10 +274,57 @@ class KsDashboardNinjaBoard(models.Model):
         items = {}
         item_model = self.env['ks_dashboard_ninja.item']
         for item_id in item_list:
-            item = self.ks_fetch_item_data(item_model.browse(item_id), params)
+            item = self.ks_fetch_cached_item_data(item_model.browse(item_id), params)
             items[item['id']] = item
         return items
 
+    def ks_fetch_cached_item_data(self, rec, params={}):
+        """
+        Return the item data from the cache shared by the users seeing the same records, computing it when missing.
+        :param rec: item object
+        :return: object with formatted item data
+        """
+        ks_cache_timeout = rec.ks_cache_timeout
+        # an item refreshed by interval must not be shown older than its interval
+        if rec.ks_auto_update_type != 'ks_live_update' and rec.ks_update_items_data:
+            ks_cache_timeout = min(ks_cache_timeout, int(rec.ks_update_items_data) // 1000)
+        # the to-do lines are not followed by the live update
+        if ks_cache_timeout <= 0 or rec.ks_dashboard_item_type == 'ks_to_do':
+            return self.ks_fetch_item_data(rec, params)
+
+        rec = rec.with_context(ks_proper_domains={})
+        item_domain1 = params.get('ks_domain_1', [])
+        ks_cache_key = (
+            rec.id,
+            rec.write_date,
+            rec.ks_cache_generation,
+            repr(rec.ks_convert_into_proper_domain(rec.ks_domain, rec, item_domain1)),
+            repr(params.get('ks_domain_2', [])),
+            repr([self._context.get(key) for key in ('ksDateFilterSelection', 'ksDateFilterStartDate',
+                                                     'ksDateFilterEndDate', 'lang', 'tz')]),
+            self.env.company.id,
+            tuple(self.env.companies.ids),
+            # the currency symbol is the one of the company of the user
+            self.env.user.company_id.id,
+            self.ks_get_rule_fingerprint(rec),
+        )
+        ks_cache = ks_item_data_caches[self.env.cr.dbname]
+        item = ks_cache.get(ks_cache_key)
+        if item is None:
+            item = self.ks_fetch_item_data(rec, params)
+            ks_cache.set(ks_cache_key, item, ks_cache_timeout)
+        return dict(item)
+
+    def ks_get_rule_fingerprint(self, rec):
+        """
+        Identify the records the user can read on the item models, users with the same fingerprint share the cache.
+        :param rec: item object
+        :return: tuple
+        """
+        ks_model_names = [model for model in (rec.ks_model_name, rec.ks_model_name_2) if model]
+        ks_rule_domains = [repr(self.env['ir.rule']._compute_domain(model, 'read')) for model in ks_model_names]
+        return tuple(ks_rule_domains) + tuple(self.env.user.groups_id.ids)
+
     # fetching Item info (Divided to make function inherit easily)
     def ks_fetch_item_data(self, rec, params={}):
         """
@@ -326,6 +384,10 @@ class KsDashboardNinjaBoard(models.Model):
                 ks_currency_symbol = False
                 ks_currency_position = False
 
+        # The data sections share the domain resolved once for this item
+        if rec._context.get('ks_proper_domains') is None:
+            rec = rec.with_context(ks_proper_domains={})
+        ks_item_sections = self.ks_fetch_item_sections(rec, item_domain1, item_domain2)
 
         item = {
             'name': rec.name if rec.name else rec.ks_model_id.name if rec.ks_model_id else "Name",
@@ -341,7 +403,7 @@ class KsDashboardNinjaBoard(models.Model):
             'ks_model_name': rec.ks_model_name,
             'ks_model_display_name': rec.ks_model_id.name,
             'ks_record_count_type': rec.ks_record_count_type,
-            'ks_record_count': rec._ksGetRecordCount(item_domain1),
+            'ks_record_count': ks_item_sections['ks_record_count'],
             'id': rec.id,
             'ks_layout': rec.ks_layout,
             'ks_icon_select': rec.ks_icon_select,
@@ -355,15 +417,15 @@ class KsDashboardNinjaBoard(models.Model):
             'ks_chart_relation_groupby_name': rec.ks_chart_relation_groupby.name,
             'ks_chart_date_groupby': rec.ks_chart_date_groupby,
             'ks_record_field': rec.ks_record_field.id if rec.ks_record_field else False,
-            'ks_chart_data': rec._ks_get_chart_data(item_domain1),
-            'ks_list_view_data': rec._ksGetListViewData(item_domain1),
+            'ks_chart_data': ks_item_sections['ks_chart_data'],
+            'ks_list_view_data': ks_item_sections['ks_list_view_data'],
             'ks_chart_data_count_type': rec.ks_chart_data_count_type,
             'ks_bar_chart_stacked': rec.ks_bar_chart_stacked,
             'ks_semi_circle_chart': rec.ks_semi_circle_chart,
             'ks_list_view_type': rec.ks_list_view_type,
             'ks_list_view_group_fields': rec.ks_list_view_group_fields.ids if rec.ks_list_view_group_fields else False,
             'ks_previous_period': rec.ks_previous_period,
-            'ks_kpi_data': rec._ksGetKpiData(item_domain1, item_domain2),
+            'ks_kpi_data': ks_item_sections['ks_kpi_data'],
             'ks_goal_enable': rec.ks_goal_enable,
             'ks_model_id_2': rec.ks_model_id_2.id,
             'ks_record_field_2': rec.ks_record_field_2.id,
@@ -389,7 +451,7 @@ class KsDashboardNinjaBoard(models.Model):
             'ks_chart_cumulative_field': rec.ks_chart_cumulative_field.id,
             'ks_chart_cumulative': rec.ks_chart_cumulative,
             'ks_button_color': rec.ks_button_color,
-            'ks_to_do_data': rec._ksGetToDOData(),
+            'ks_to_do_data': ks_item_sections['ks_to_do_data'],
             'ks_multiplier_active': rec.ks_multiplier_active,
             'ks_multiplier': rec.ks_multiplier,
             'ks_goal_liness':True if rec.ks_goal_lines else False,
@@ -399,6 +461,27 @@ class KsDashboardNinjaBoard(models.Model):
         }
         return item
 
+    def ks_fetch_item_sections(self, rec, item_domain1=[], item_domain2=[]):
+        """
+        Compute only the data sections displayed by the item type, the others keep their empty value.
+        :param rec: item object
+        :return: dict of the data sections
+        """
+        ks_section_getters = {
+            'ks_record_count': lambda: rec._ksGetRecordCount(item_domain1),
+            'ks_chart_data': lambda: rec._ks_get_chart_data(item_domain1),
+            'ks_list_view_data': lambda: rec._ksGetListViewData(item_domain1),
+            'ks_kpi_data': lambda: rec._ksGetKpiData(item_domain1, item_domain2),
+            'ks_to_do_data': lambda: rec._ksGetToDOData(),
+        }
+        ks_item_sections = {}
+        for section, (item_types, empty_value) in KS_ITEM_DATA_SECTIONS.items():
+            if rec.ks_dashboard_item_type in item_types:
+                ks_item_sections[section] = ks_section_getters[section]()
+            else:
+                ks_item_sections[section] = empty_value
+        return ks_item_sections
+
     def ks_set_date(self, ks_dashboard_id):
         ks_dashboard_rec = self.browse(ks_dashboard_id)
         if self._context.get('ksDateFilterSelection', False):
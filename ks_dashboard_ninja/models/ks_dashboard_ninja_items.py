@@ -10,7 +10,7 @@ from odoo.tools.safe_eval import safe_eval
 from collections import defaultdict
 from datetime import datetime
 from dateutil import relativedelta
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError, UserError
 from odoo.addons.ks_dashboard_ninja.lib.ks_date_filter_selections import ks_get_date, ks_convert_into_utc, \
     ks_convert_into_local
@@ -534,6 +534,13 @@ class KsDashboardNinjaItems(models.Model):
         help='Select the update type.')
     ks_show_live_pop_up = fields.Boolean(string='Show Live Update Pop Up',
                                          help='Checkbox to enable notification after every update. ')
+    ks_cache_timeout = fields.Integer(string='Cache Duration', default=0,
+                                      help='Seconds during which the computed data of the item is reused by all the '
+                                           'users sharing the same filters and access rules. Live update items are '
+                                           'recomputed as soon as their model changes, the other ones are kept at '
+                                           'most for their update interval. Set 0 to disable the cache.')
+    # Incremented after each committed change of a live update item model, see ks_notify_live_update
+    ks_cache_generation = fields.Integer(default=0, readonly=True, copy=False)
 
     ks_is_client_action = fields.Boolean('Client Action', default=False)
     ks_client_action = fields.Many2one('ir.actions.client',
@@ -734,8 +741,10 @@ class KsDashboardNinjaItems(models.Model):
             }
             values['ks_many2many_field_ordering'] = json.dumps(ks_many2many_field_ordering)
 
-        return super(KsDashboardNinjaItems, self).create(
-            values)
+        res = super(KsDashboardNinjaItems, self).create(values)
+        if res.ks_auto_update_type == 'ks_live_update':
+            self.clear_caches()
+        return res
 
     def write(self, values):
         for rec in self:
@@ -749,8 +758,24 @@ class KsDashboardNinjaItems(models.Model):
                 ks_many2many_field_ordering['ks_list_view_group_fields'] = values['ks_list_view_group_fields'][0][2]
             values['ks_many2many_field_ordering'] = json.dumps(ks_many2many_field_ordering)
 
-        return super(KsDashboardNinjaItems, self).write(
-            values)
+        res = super(KsDashboardNinjaItems, self).write(values)
+        if {'ks_model_id', 'ks_auto_update_type'} & set(values):
+            self.clear_caches()
+        return res
+
+    def unlink(self):
+        if any(rec.ks_auto_update_type == 'ks_live_update' for rec in self):
+            self.clear_caches()
+        return super(KsDashboardNinjaItems, self).unlink()
+
+    @api.model
+    @tools.ormcache()
+    def _ks_get_live_update_items(self):
+        """ Return the ids of the live update items by model name, cached until an item changes """
+        ks_live_items = defaultdict(list)
+        for rec in self.sudo().search([('ks_auto_update_type', '=', 'ks_live_update'), ('ks_model_id', '!=', False)]):
+            ks_live_items[rec.ks_model_id.model].append(rec.id)
+        return {model: tuple(item_ids) for model, item_ids in ks_live_items.items()}
 
     @api.onchange('ks_layout')
     def layout_four_font_change(self):
@@ -926,6 +951,12 @@ class KsDashboardNinjaItems(models.Model):
         return data
 
     def ks_convert_into_proper_domain(self, ks_domain, rec, domain=[]):
+        # Resolved domains shared by the data sections of an item, see ks_fetch_item_data
+        ks_proper_domains = self._context.get('ks_proper_domains')
+        ks_domain_key = (rec.id, ks_domain if ks_domain != '[]' else False, repr(domain))
+        if ks_proper_domains is not None and ks_domain_key in ks_proper_domains:
+            return list(ks_proper_domains[ks_domain_key])
+
         if ks_domain and "%UID" in ks_domain:
             ks_domain = ks_domain.replace('"%UID"', str(self.env.user.id))
 
@@ -1046,6 +1077,8 @@ class KsDashboardNinjaItems(models.Model):
         if domain:
             proper_domain.extend(domain)
 
+        if ks_proper_domains is not None:
+            ks_proper_domains[ks_domain_key] = list(proper_domain)
         return proper_domain
 
     def ks_convert_domain_extension(self, ks_extensiom_domain, rec):
@@ -1,4 +1,59 @@
-from odoo import models, fields, api, _
+import logging
+from functools import partial
+
+from psycopg2 import OperationalError
+
+from odoo import models, fields, api, _, SUPERUSER_ID
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+
+_logger = logging.getLogger(__name__)
+
+# Key of the (changed, notified) live update items of the current transaction, in the cursor postcommit data
+KS_LIVE_UPDATE_KEY = 'ks_dashboard_ninja.live_update'
+# Attempts to outdate the cached data of the items when concurrent transactions outdate them too
+KS_CACHE_BUMP_TRIES = 5
+
+
+def ks_outdate_item_cache(db_registry, item_ids):
+    """ Outdate the cached data of the items in every worker, retried when a concurrent commit outdates them too """
+    for tries in range(1, KS_CACHE_BUMP_TRIES + 1):
+        try:
+            with db_registry.cursor() as cr:
+                cr.execute("""
+                    UPDATE ks_dashboard_ninja_item
+                       SET ks_cache_generation = COALESCE(ks_cache_generation, 0) + 1
+                     WHERE id IN %s
+                       AND ks_cache_timeout > 0
+                """, [tuple(item_ids)])
+            return
+        except OperationalError as e:
+            if e.pgcode not in PG_CONCURRENCY_ERRORS_TO_RETRY or tries == KS_CACHE_BUMP_TRIES:
+                raise
+
+
+def ks_notify_live_update(db_registry, item_ids, notified_item_ids):
+    """ Outdate the cache of the live update items changed by a committed transaction and send a single
+    notification for the `notified_item_ids` among them """
+    # the changes are already committed, a failure must neither fail the transaction nor drop the notification
+    try:
+        ks_outdate_item_cache(db_registry, item_ids)
+    except Exception:
+        _logger.exception("Dashboard Ninja item cache invalidation failed")
+    if not notified_item_ids:
+        return
+    try:
+        with db_registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            online_partner = env['bus.presence'].search([('status', '=', 'online')]).mapped('user_id.partner_id').ids
+            if online_partner:
+                changes = sorted(notified_item_ids)
+                updates = [[
+                    (cr.dbname, 'res.partner', partner_id),
+                    {'type': 'ks_dashboard_ninja.notification', 'changes': changes}
+                ] for partner_id in online_partner]
+                env['bus.bus'].sendmany(updates)
+    except Exception:
+        _logger.exception("Dashboard Ninja live update notification failed")
 
 
 class Base(models.AbstractModel):
@@ -7,30 +62,29 @@ class Base(models.AbstractModel):
     @api.model_create_multi
     def create(self, vals_list):
         recs = super(Base, self).create(vals_list)
-        if 'ir.' not in self._name and self.env.user.has_group('base.group_user'):
-            items = self.env['ks_dashboard_ninja.item'].search(
-                [['ks_model_id.model', '=', self._name], ['ks_auto_update_type', '=', 'ks_live_update']])
-            if items:
-                online_partner = self.env['res.users'].search([]).filtered(lambda x: x.im_status == 'online').mapped(
-                    "partner_id").ids
-                updates = [[
-                    (self._cr.dbname, 'res.partner', partner_id),
-                    {'type': 'ks_dashboard_ninja.notification', 'changes': items.ids}
-                ] for partner_id in online_partner]
-                self.env['bus.bus'].sendmany(updates)
+        recs._ks_collect_live_update()
         return recs
 
     def write(self, vals):
         recs = super(Base, self).write(vals)
-        if 'ir.' not in self._name and self.env.user.has_group('base.group_user'):
-            items = self.env['ks_dashboard_ninja.item'].search(
-                [['ks_model_id.model', '=', self._name], ['ks_auto_update_type', '=', 'ks_live_update']])
-            if items:
-                online_partner = self.env['res.users'].search([]).filtered(lambda x: x.im_status == 'online').mapped(
-                    "partner_id").ids
-                updates = [[
-                    (self._cr.dbname, 'res.partner', partner_id),
-                    {'type': 'ks_dashboard_ninja.notification', 'changes': items.ids}
-                ] for partner_id in online_partner]
-                self.env['bus.bus'].sendmany(updates)
+        self._ks_collect_live_update()
         return recs
+
+    def _ks_collect_live_update(self):
+        """ Remember the live update items watching this model, they are notified once after commit """
+        # the technical models are not watched, the item model is not in the registry yet while the module is installed
+        if 'ir.' in self._name or 'ks_dashboard_ninja.item' not in self.env:
+            return
+        item_ids = self.env['ks_dashboard_ninja.item']._ks_get_live_update_items().get(self._name)
+        if not item_ids:
+            return
+        postcommit = self.env.cr.postcommit
+        changes = postcommit.data.get(KS_LIVE_UPDATE_KEY)
+        if changes is None:
+            changes = postcommit.data[KS_LIVE_UPDATE_KEY] = (set(), set())
+            postcommit.add(partial(ks_notify_live_update, self.env.registry, *changes))
+        changed_item_ids, notified_item_ids = changes
+        # the cache is outdated by every writer, only the changes of internal users are pushed to the dashboards
+        changed_item_ids.update(item_ids)
+        if self.env.user.has_group('base.group_user'):
+            notified_item_ids.update(item_ids)